@@ -1,13 +1,33 @@
-from flask import Flask
+import os
+from flask import Flask, request
 from config import Config
 from routes import bp
 from flask_login import LoginManager
 from auth import User
+from werkzeug.middleware.proxy_fix import ProxyFix
 
 
 app = Flask(__name__)
 app.config.from_object(Config)
 
+if Config.TRUSTED_PROXIES:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=Config.TRUSTED_PROXIES)
+elif os.getenv('DYNO'):
+    print("⚠ TRUSTED_PROXIES is 0 behind Heroku's router: all clients share one IP and "
+          "per-IP rate limits become platform-wide. Set TRUSTED_PROXIES=1.")
+
+
+_proxy_warned = False
+
+@app.before_request
+def warn_untrusted_proxy():
+    """Warn once per worker if requests arrive through a proxy that isn't trusted"""
+    global _proxy_warned
+    if not _proxy_warned and not Config.TRUSTED_PROXIES and 'X-Forwarded-For' in request.headers:
+        _proxy_warned = True
+        print(f"⚠ Requests carry X-Forwarded-For but TRUSTED_PROXIES is 0: rate limits see "
+              f"{request.remote_addr} for every client. Set TRUSTED_PROXIES to the number of proxies.")
+
 # Initialize Flask-Login
 login_manager = LoginManager()
 login_manager.init_app(app)
@@ -24,7 +44,13 @@ def load_user(user_id):
 app.register_blueprint(bp)
 
 
+def warm_up():
+    """Connect and ensure indexes now rather than on the first request"""
+    from models import Database
+    Config.check_connection()
+    Database.for_school(Config.DEFAULT_SCHOOL_ID)
+
+
 if __name__ == '__main__':
-    import os
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port, debug=False)
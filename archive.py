@@ -0,0 +1,130 @@
+"""Move old activities out of the hot collection.
+
+    python archive.py                 # every school, Config.ARCHIVE_HORIZON_DAYS
+    python archive.py --days 180      # custom horizon
+    python archive.py --school SCHOOL
+
+Whole months older than the horizon are copied into `activities_archive_YYYY_MM`,
+summarised per student/course/month into `activity_summaries`, and only then
+deleted from `activities`. Every step is idempotent, so an interrupted run can
+simply be started again. Run it from a scheduler (e.g. nightly).
+"""
+import sys
+from datetime import datetime, timezone, timedelta
+from config import Config
+from models import Database, ARCHIVE_PREFIX
+
+DELETE_BATCH = 1000
+
+
+def archive_name(year, month):
+    return f"{ARCHIVE_PREFIX}{year:04d}_{month:02d}"
+
+
+def next_month(year, month):
+    return (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def months_to_archive(database, cutoff):
+    """(year, month) for every month with hot activities that ended before `cutoff`"""
+    oldest = database.db.activities.find_one(
+        database._scoped({'completed_at': {'$lt': cutoff}}),
+        {'completed_at': 1},
+        sort=[('completed_at', 1)]
+    )
+    if not oldest:
+        return []
+    year, month = int(oldest['completed_at'][:4]), int(oldest['completed_at'][5:7])
+    months = []
+    while '%04d-%02d-01' % next_month(year, month) <= cutoff:
+        months.append((year, month))
+        year, month = next_month(year, month)
+    return months
+
+
+def archive_month(database, year, month):
+    start = f"{year:04d}-{month:02d}-01"
+    end = '%04d-%02d-01' % next_month(year, month)
+    name = archive_name(year, month)
+    in_month = database._scoped({'completed_at': {'$gte': start, '$lt': end}})
+
+    # 1. Copy into the month's archive collection
+    database.db[name].create_index([('school_id', 1), ('student_id', 1), ('completed_at', -1)])
+    database.db.activities.aggregate([
+        {'$match': in_month},
+        {'$merge': {'into': name, 'on': '_id', 'whenMatched': 'keepExisting', 'whenNotMatched': 'insert'}}
+    ])
+
+    # 2. Summarise the whole archived month (replacing any earlier summary of it)
+    positive = {'$gt': ['$score', 0]}
+    database.db[name].aggregate([
+        {'$match': database._scoped()},
+        {'$group': {
+            '_id': {'student_id': '$student_id', 'course_id': '$course_id'},
+            'count': {'$sum': 1},
+            'score_sum': {'$sum': {'$cond': [positive, '$score', 0]}},
+            'score_n': {'$sum': {'$cond': [positive, 1, 0]}},
+            'first_at': {'$min': '$completed_at'},
+            'last_at': {'$max': '$completed_at'},
+            'topics': {'$addToSet': '$topic'}
+        }},
+        {'$project': {
+            '_id': {'$concat': [
+                database.school_id, ':',
+                {'$ifNull': ['$_id.student_id', '']}, ':',
+                {'$ifNull': ['$_id.course_id', '']},
+                f":{year:04d}-{month:02d}"
+            ]},
+            'school_id': database.school_id,
+            'student_id': '$_id.student_id',
+            'course_id': '$_id.course_id',
+            'month': f"{year:04d}-{month:02d}",
+            'count': 1, 'score_sum': 1, 'score_n': 1, 'first_at': 1, 'last_at': 1, 'topics': 1
+        }},
+        {'$merge': {'into': 'activity_summaries', 'on': '_id', 'whenMatched': 'replace', 'whenNotMatched': 'insert'}}
+    ])
+
+    # 3. Delete from the hot collection only what is now safely archived
+    moved = 0
+    ids = []
+    for doc in database.db[name].find(database._scoped(), {'_id': 1}):
+        ids.append(doc['_id'])
+        if len(ids) == DELETE_BATCH:
+            moved += database.db.activities.delete_many({'_id': {'$in': ids}}).deleted_count
+            ids = []
+    if ids:
+        moved += database.db.activities.delete_many({'_id': {'$in': ids}}).deleted_count
+    return moved
+
+
+def archive_school(school_id, horizon_days):
+    database = Database.for_school(school_id)
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=horizon_days)).strftime('%Y-%m-%d')
+    for year, month in months_to_archive(database, cutoff):
+        moved = archive_month(database, year, month)
+        print(f"{school_id}: archived {moved} activities from {year:04d}-{month:02d}")
+
+
+def all_schools():
+    directory = Config.get_client()[Config.DB]
+    schools = set(directory.schools.distinct('_id')) | set(Config.TENANT_DATABASES)
+    schools.add(Config.DEFAULT_SCHOOL_ID)
+    return sorted(s for s in schools if s)
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    horizon = Config.ARCHIVE_HORIZON_DAYS
+    schools = None
+    while args:
+        flag = args.pop(0)
+        if flag == '--days' and args:
+            horizon = int(args.pop(0))
+        elif flag == '--school' and args:
+            schools = [args.pop(0)]
+        else:
+            print(__doc__)
+            sys.exit(1)
+    for school_id in schools or all_schools():
+        archive_school(school_id, horizon)
+    print("✓ Archival complete")
@@ -1,5 +1,7 @@
 from flask_login import UserMixin
+from config import Config
 from models import Database
+from user_cache import user_cache
 
 class User(UserMixin):
     """User class for Flask-Login"""
@@ -11,6 +13,7 @@ class User(UserMixin):
         self.role = user_data['role']
         self._is_active = user_data.get('is_active', True)
         self.student_id = user_data.get('student_id')
+        self.school_id = user_data.get('school_id') or Config.DEFAULT_SCHOOL_ID
     
     
     @property
@@ -38,9 +41,9 @@ class User(UserMixin):
     
     @staticmethod
     def get(user_id):
-        """Load user by ID"""
-        db = Database()
-        user_data = db.get_user_by_id(user_id)
+        """Load user by ID, served from the per-worker user cache when possible"""
+        # Users are in the shared directory, so any school's Database can load them
+        user_data = user_cache.get(user_id, Database.for_school(Config.DEFAULT_SCHOOL_ID))
         if user_data:
             return User(user_data)
         return None
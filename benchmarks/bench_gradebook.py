@@ -0,0 +1,70 @@
+"""Gradebook build time: vectorized matrix vs per-student Python loops.
+
+Run from the project root:  python -m benchmarks.bench_gradebook [students] [topics] [per_cell]
+Defaults to 5,000 students x 50 topics with ~2 activities per cell. The
+columns are generated in memory, so this times the matrix build only; the
+projected cursor read is the same for both paths.
+
+Exits non-zero if the vectorized build takes longer than
+Config.GRADEBOOK_BUDGET_MS per 500,000 activities.
+"""
+import sys
+import time
+
+import numpy as np
+
+from config import Config
+from gradebook import build_matrix
+
+
+def make_columns(n_students, n_topics, per_cell, seed=7):
+    rng = np.random.default_rng(seed)
+    n = n_students * n_topics * per_cell
+    student_ids = [f"{i:024x}" for i in rng.integers(0, n_students, n)]
+    topics = [f"Topic {i}" for i in rng.integers(0, n_topics, n)]
+    raw_scores = rng.integers(40, 101, n)
+    scores = [None if i % 4 == 0 else int(s) for i, s in enumerate(raw_scores)]
+    return [f"Topic {i}" for i in range(n_topics)], student_ids, topics, scores
+
+
+def loop_build(course_topics, student_ids, topics, scores):
+    # What get_course_progress-style code would do: group per student, then per topic
+    by_student = {}
+    for sid, topic, score in zip(student_ids, topics, scores):
+        by_student.setdefault(sid, []).append((topic, score))
+    result = {}
+    for sid, activities in by_student.items():
+        row = []
+        for topic in course_topics:
+            topic_scores = [s for t, s in activities if t == topic and s is not None]
+            done = any(t == topic for t, _ in activities)
+            row.append((done, sum(topic_scores) / len(topic_scores) if topic_scores else None))
+        result[sid] = row
+    return result
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    n_students = int(sys.argv[1]) if len(sys.argv) > 1 else 5_000
+    n_topics = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    per_cell = int(sys.argv[3]) if len(sys.argv) > 3 else 2
+    columns = make_columns(n_students, n_topics, per_cell)
+    n = len(columns[1])
+    budget = Config.GRADEBOOK_BUDGET_MS * n / 500_000
+    print(f"{n_students} students x {n_topics} topics, {n} activities")
+    vectorized = timed(build_matrix, *columns)
+    print(f"  vectorized {vectorized:10.1f} ms   budget {budget:.0f} ms")
+    print(f"  loop       {timed(loop_build, *columns):10.1f} ms")
+    if vectorized > budget:
+        print("✗ Over gradebook budget")
+        sys.exit(1)
+    print("✓ Within gradebook budget")
+
+
+if __name__ == '__main__':
+    main()
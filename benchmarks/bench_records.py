@@ -0,0 +1,71 @@
+"""Memory benchmark: full decoded dicts vs projected rows for list pages.
+
+Run from the project root:  python -m benchmarks.bench_records [count]
+Works offline - documents are generated and BSON-encoded locally, so the
+numbers reflect what a worker holds after a listing query, not network time.
+"""
+import sys
+import tracemalloc
+from datetime import datetime, timezone
+
+import bson
+from bson.raw_bson import RawBSONDocument
+
+from records import StudentRow
+
+
+def make_documents(count):
+    now = datetime.now(timezone.utc).isoformat()
+    return [
+        bson.encode({
+            '_id': bson.ObjectId(),
+            'name': f"Student {i}",
+            'email': f"student{i}@example.com",
+            'phone_number': '+2348123456789',
+            'created_at': now,
+            'guardian': {'name': f"Parent {i}", 'email': f"parent{i}@example.com"},
+            'notes': 'x' * 200,
+        })
+        for i in range(count)
+    ]
+
+
+def dict_path(buffers):
+    # Mirrors Database.get_all_students: decode everything, rewrite _id
+    students = [bson.decode(buf) for buf in buffers]
+    for student in students:
+        student['_id'] = str(student['_id'])
+    return students
+
+
+def row_path(buffers):
+    projection = set(StudentRow.fields) | {'_id'}
+    rows = []
+    for buf in buffers:
+        # Server-side projection is simulated by dropping unprojected keys before encoding
+        doc = RawBSONDocument(bson.encode({k: v for k, v in bson.decode(buf).items() if k in projection}))
+        rows.append(StudentRow.from_doc(doc))
+    return rows
+
+
+def measure(fn, buffers):
+    tracemalloc.start()
+    result = fn(buffers)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current, peak
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    buffers = make_documents(count)
+    print(f"{count} students")
+    for label, fn in (('dict', dict_path), ('row', row_path)):
+        result, current, peak = measure(fn, buffers)
+        print(f"  {label:<5} retained {current / 1024 / 1024:8.2f} MiB  "
+              f"peak {peak / 1024 / 1024:8.2f} MiB  per-record {current / count:7.0f} B")
+        del result
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""Worker boot budget: import time of the app and time to serve a first request.
+
+Run from the project root:  python -m benchmarks.bench_startup [runs]
+Exits non-zero if the median boot exceeds Config.STARTUP_BUDGET_MS or if a
+module that should load lazily is imported at boot. No database is needed:
+booting must not touch Mongo.
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Loaded on first use only (workbook export, gradebook, student creation)
+LAZY_MODULES = ['openpyxl', 'numpy', 'phonenumbers', 'gridfs']
+
+PROBE = r'''
+import sys, time, json
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+client = app.app.test_client()
+response = client.get('/login')
+served = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - start) * 1000,
+    'first_request_ms': (served - imported) * 1000,
+    'status': response.status_code,
+    'loaded': [m for m in %r if m in sys.modules],
+}))
+'''
+
+
+def boot_once():
+    env = dict(os.environ)
+    # Boot must work without a reachable database or complete settings
+    env.setdefault('MONGODB_DB', 'startup_probe')
+    env.setdefault('MONGO_URI', 'mongodb://127.0.0.1:1')
+    result = subprocess.run(
+        [sys.executable, '-c', PROBE % LAZY_MODULES],
+        env=env, capture_output=True, text=True, timeout=120
+    )
+    if result.returncode:
+        sys.stderr.write(result.stderr)
+        raise SystemExit("✗ App failed to boot")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    from config import Config
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    samples = [boot_once() for _ in range(runs)]
+    import_ms = statistics.median(s['import_ms'] for s in samples)
+    request_ms = statistics.median(s['first_request_ms'] for s in samples)
+    total = import_ms + request_ms
+    loaded = sorted({m for s in samples for m in s['loaded']})
+
+    print(f"import app      {import_ms:8.1f} ms (median of {runs})")
+    print(f"first request   {request_ms:8.1f} ms")
+    print(f"boot total      {total:8.1f} ms   budget {Config.STARTUP_BUDGET_MS} ms")
+
+    failed = False
+    if loaded:
+        print(f"✗ Loaded eagerly at boot: {', '.join(loaded)}")
+        failed = True
+    if samples[0]['status'] != 200:
+        print(f"✗ First request returned {samples[0]['status']}")
+        failed = True
+    if total > Config.STARTUP_BUDGET_MS:
+        print("✗ Over startup budget")
+        failed = True
+    if failed:
+        sys.exit(1)
+    print("✓ Within startup budget")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,345 @@
+"""End-to-end load test: gunicorn + Flask + a local mongod under mixed traffic.
+
+Run from the project root against a local, disposable database:
+
+    MONGO_URI=mongodb://localhost:27017 MONGODB_DB=edu_loadtest \\
+        python -m benchmarks.loadtest --users 200 --ramp 60 --duration 180
+
+The harness seeds teachers, students, courses and activities, launches the app
+with the Procfile's gunicorn command (unless --base-url points at a running
+instance), starts virtual users following a load profile and then reports
+latency percentiles and throughput per route. Each virtual user signs in once
+and then loops over a weighted mix of dashboard loads, student detail views,
+activity logging and exports with a short think time.
+
+Profiles (--profile) shape how many users are active over time:
+
+    linear   ramp to --users over --ramp seconds, then hold (default)
+    step     reach --users in four equal steps spread over --ramp
+    spike    hold a tenth of --users, jump to all of them at half the
+             duration for a quarter of it, then drop back
+
+or --stages gives explicit "users@seconds" stages, each ramping to that many
+users over that many seconds (0 = at once; lower counts stop users), e.g.
+"50@30,50@60,300@0,300@30,50@0". --login-burst N additionally signs N fresh
+clients in at the same instant (at --burst-at seconds), reported as the
+`login_burst` route, e.g. the start of a lesson when a class logs in together.
+
+Every virtual user connects from 127.0.0.1, so the launched app runs with
+per-process, effectively unlimited rate limits; otherwise the run would
+measure the limiter rather than gunicorn, Flask and Mongo. Pass
+--keep-rate-limits to test the configured limits instead (shed requests
+show up as 429s). Virtual users whose sign-in fails are counted and reported.
+"""
+import argparse
+import json
+import http.cookiejar
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+
+DEFAULT_MIX = 'dashboard=30,student=30,log=25,export=10,courses=5'
+PASSWORD = 'loadtest-password'
+UNLIMITED = {group: {'global': '1000000/1'} for group in ('login', 'register', 'log_activity', 'sync')}
+
+
+def parse_mix(spec):
+    mix = {}
+    for part in spec.split(','):
+        name, weight = part.split('=')
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+def parse_stages(spec):
+    """'50@30,300@0' -> [(50, 30.0), (300, 0.0)]"""
+    stages = []
+    for part in spec.split(','):
+        users, seconds = part.split('@')
+        stages.append((int(users), float(seconds)))
+    return stages
+
+
+def profile_stages(profile, users, ramp, duration):
+    if profile == 'step':
+        steps = 4
+        return [
+            stage
+            for k in range(1, steps + 1)
+            for stage in ((round(users * k / steps), 0), (round(users * k / steps), ramp / steps))
+        ]
+    if profile == 'spike':
+        base = max(1, users // 10)
+        spike_at = max(ramp, duration / 2)
+        return [(base, ramp), (base, spike_at - ramp), (users, 0), (users, duration / 4), (base, 0)]
+    return [(users, ramp)]
+
+
+def percentile(sorted_samples, q):
+    if not sorted_samples:
+        return float('nan')
+    index = min(len(sorted_samples) - 1, int(q * len(sorted_samples)))
+    return sorted_samples[index]
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    # Time each request on its own; a redirect counts as the response
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class Results:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = defaultdict(list)    # route -> [seconds]
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.failed_logins = 0
+
+    def login_failed(self):
+        with self._lock:
+            self.failed_logins += 1
+
+    def record(self, route, elapsed, status):
+        with self._lock:
+            self.samples[route].append(elapsed)
+            self.statuses[route][status] += 1
+
+    def report(self, wall_seconds):
+        print(f"\n{'route':<12}{'count':>8}{'rps':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}  statuses")
+        for route in sorted(self.samples):
+            samples = sorted(self.samples[route])
+            statuses = ' '.join(f"{code}:{n}" for code, n in sorted(self.statuses[route].items(), key=str))
+            print(f"{route:<12}{len(samples):>8}{len(samples) / wall_seconds:>8.1f}"
+                  f"{percentile(samples, 0.50) * 1000:>10.1f}{percentile(samples, 0.95) * 1000:>10.1f}"
+                  f"{percentile(samples, 0.99) * 1000:>10.1f}  {statuses}")
+        total = sum(len(s) for s in self.samples.values())
+        print(f"\n{total} requests in {wall_seconds:.1f}s ({total / wall_seconds:.1f} req/s)")
+        if self.failed_logins:
+            print(f"✗ {self.failed_logins} virtual user(s) could not sign in and sent no further traffic")
+
+
+class VirtualUser(threading.Thread):
+    def __init__(self, base_url, email, fixtures, mix, results, stop_at, think_time):
+        super().__init__(daemon=True)
+        self.base_url = base_url
+        self.email = email
+        self.fixtures = fixtures
+        self.routes = list(mix)
+        self.weights = [mix[route] for route in self.routes]
+        self.results = results
+        self.stop_at = stop_at
+        self.think_time = think_time
+        self.retired = threading.Event()    # set when a stage scales users down
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()),
+            NoRedirect()
+        )
+
+    def request(self, route, path, form=None):
+        data = urllib.parse.urlencode(form).encode() if form is not None else None
+        start = time.perf_counter()
+        try:
+            with self.opener.open(self.base_url + path, data=data, timeout=60) as response:
+                response.read()
+                status = response.status
+        except urllib.error.HTTPError as e:
+            status = e.code
+        except (urllib.error.URLError, TimeoutError, ConnectionError):
+            status = 'error'
+        self.results.record(route, time.perf_counter() - start, status)
+        return status
+
+    def run(self):
+        if self.request('login', '/login', {'email': self.email, 'password': PASSWORD}) != 302:
+            self.results.login_failed()
+            return
+        while time.monotonic() < self.stop_at and not self.retired.is_set():
+            route = random.choices(self.routes, self.weights)[0]
+            student_id = random.choice(self.fixtures['students'])
+            if route == 'dashboard':
+                self.request(route, '/')
+            elif route == 'student':
+                self.request(route, f"/students/{student_id}")
+            elif route == 'log':
+                course_id, topic = random.choice(self.fixtures['courses'])
+                self.request(route, '/activities/log', {
+                    'student_id': student_id,
+                    'course_id': course_id,
+                    'activity_type': random.choice(['quiz', 'assignment', 'lesson']),
+                    'topic': topic,
+                    'score': random.randint(40, 100),
+                    'notes': 'load test'
+                })
+            elif route == 'export':
+                self.request(route, f"/export/student/{student_id}")
+            elif route == 'courses':
+                self.request(route, '/courses')
+            time.sleep(random.uniform(0, self.think_time * 2))
+
+
+class BurstUser(VirtualUser):
+    """A fresh client that only signs in, released together with the rest of its burst"""
+
+    def __init__(self, base_url, email, results, barrier):
+        super().__init__(base_url, email, {}, {'login_burst': 1}, results, 0, 0)
+        self.barrier = barrier
+
+    def run(self):
+        self.barrier.wait()
+        self.request('login_burst', '/login', {'email': self.email, 'password': PASSWORD})
+
+
+def seed(n_teachers, n_students, n_courses, activities_per_student):
+    from models import Database
+    db = Database()
+    print(f"Seeding {n_teachers} teachers, {n_students} students, {n_courses} courses...")
+    teachers = []
+    for i in range(n_teachers):
+        email = f"loadtest-teacher-{i}@example.com"
+        if not db.get_user_by_email(email):
+            db.create_user(email, PASSWORD, f"Load Teacher {i}", role='teacher')
+        teachers.append(email)
+
+    courses = [(c['_id'], c['topics'][0]) for c in db.get_all_courses() if c['title'].startswith('Load Course') and c['topics']]
+    for i in range(len(courses), n_courses):
+        topics = [f"Topic {t}" for t in range(10)]
+        courses.append((db.add_course(f"Load Course {i}", 'Load test course', topics), topics[0]))
+
+    students = [s['_id'] for s in db.get_student_rows({'email': {'$regex': '^loadtest-student-'}})]
+    batch = []
+    for i in range(len(students), n_students):
+        batch.append({
+            'school_id': db.school_id,
+            'name': f"Load Student {i}",
+            'email': f"loadtest-student-{i}@example.com",
+            'phone_number': '+2348123456789',
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S+00:00', time.gmtime())
+        })
+    if batch:
+        students += [str(_id) for _id in db.db.students.insert_many(batch).inserted_ids]
+        activities = [
+            {
+                'school_id': db.school_id,
+                'student_id': sid,
+                'course_id': random.choice(courses)[0],
+                'activity_type': 'quiz',
+                'topic': f"Topic {random.randrange(10)}",
+                'score': random.randint(40, 100),
+                'notes': None,
+                'completed_at': time.strftime('%Y-%m-%dT%H:%M:%S+00:00', time.gmtime(time.time() - random.randrange(86400 * 180)))
+            }
+            for sid in students[-len(batch):] for _ in range(activities_per_student)
+        ]
+        for start in range(0, len(activities), 10000):
+            db.db.activities.insert_many(activities[start:start + 10000])
+    return teachers, {'students': students, 'courses': courses}
+
+
+def launch_app(port, workers, keep_rate_limits=False):
+    env = dict(os.environ, WEB_CONCURRENCY=str(workers))
+    if not keep_rate_limits:
+        env.update(RATE_LIMIT_BACKEND='memory', RATE_LIMITS=json.dumps(UNLIMITED))
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', 'app:app', '--bind', f"127.0.0.1:{port}"],
+        env=env
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(base_url + '/login', timeout=2).read()
+            return process, base_url
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError("App did not start within 60 seconds")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=100, help='virtual users (default 100)')
+    parser.add_argument('--ramp', type=float, default=30, help='seconds to start all users (default 30)')
+    parser.add_argument('--profile', choices=['linear', 'step', 'spike'], default='linear',
+                        help='how users are started over time (default linear)')
+    parser.add_argument('--stages', type=parse_stages,
+                        help='explicit "users@seconds,..." stages instead of --profile')
+    parser.add_argument('--login-burst', type=int, default=0, help='clients signing in at the same instant')
+    parser.add_argument('--burst-at', type=float, help='seconds into the run for the login burst (default half)')
+    parser.add_argument('--duration', type=float, default=120, help='total test seconds (default 120)')
+    parser.add_argument('--think-time', type=float, default=1.0, help='mean pause between requests')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f"route weights (default {DEFAULT_MIX})")
+    parser.add_argument('--teachers', type=int, default=50)
+    parser.add_argument('--students', type=int, default=2000)
+    parser.add_argument('--courses', type=int, default=10)
+    parser.add_argument('--activities', type=int, default=20, help='seeded activities per student')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers when launching the app')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--base-url', help='test an already running app instead of launching one')
+    parser.add_argument('--keep-rate-limits', action='store_true',
+                        help='launch the app with the configured RATE_LIMITS instead of disabling them')
+    args = parser.parse_args()
+
+    teachers, fixtures = seed(args.teachers, args.students, args.courses, args.activities)
+    process = None
+    base_url = args.base_url
+    if not base_url:
+        process, base_url = launch_app(args.port, args.workers, args.keep_rate_limits)
+    else:
+        print("Testing a running app: its own rate limits apply to this single-IP client")
+
+    results = Results()
+    mix = parse_mix(args.mix)
+    stages = args.stages or profile_stages(args.profile, args.users, args.ramp, args.duration)
+    started = time.monotonic()
+    stop_at = started + args.duration
+    users, active = [], []
+
+    def scale_to(count):
+        while len(active) < count:
+            email = teachers[len(users) % len(teachers)]
+            user = VirtualUser(base_url, email, fixtures, mix, results, stop_at, args.think_time)
+            user.start()
+            users.append(user)
+            active.append(user)
+        while len(active) > count:
+            active.pop().retired.set()
+
+    if args.login_burst:
+        barrier = threading.Barrier(args.login_burst)
+        burst = [BurstUser(base_url, teachers[i % len(teachers)], results, barrier) for i in range(args.login_burst)]
+        burst_at = args.duration / 2 if args.burst_at is None else args.burst_at
+        timer = threading.Timer(burst_at, lambda: [user.start() for user in burst])
+        timer.daemon = True
+        timer.start()
+        users.extend(burst)
+    try:
+        print(f"Running stages {', '.join(f'{n}@{t:g}' for n, t in stages)} against {base_url}")
+        for target, seconds in stages:
+            changes = abs(target - len(active))
+            if not changes:
+                time.sleep(max(0, min(seconds, stop_at - time.monotonic())))
+            step = 1 if target > len(active) else -1
+            for _ in range(changes):
+                if time.monotonic() >= stop_at:
+                    break
+                scale_to(len(active) + step)
+                time.sleep(seconds / changes)
+        for user in users:
+            if user.is_alive():
+                user.join(timeout=max(0, stop_at - time.monotonic()) + 60)
+    finally:
+        if process:
+            process.terminate()
+            process.wait()
+    results.report(time.monotonic() - started)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+import threading
+import time
+from pymongo.errors import PyMongoError
+from records import CourseRow
+from changes import get_router
+
+
+class CourseCatalog:
+    """Process-local read-through cache of the course catalog.
+
+    Courses change a few times a term but are read on nearly every page, so
+    the whole catalog is held in memory as an id -> course index. It is
+    marked stale by the worker's shared change stream (changes.ChangeRouter)
+    when the deployment supports one (replica sets / Atlas); otherwise, or
+    while the stream is down, reads poll a version counter in the `meta`
+    collection every `poll_interval` seconds. The cache reloads lazily on the
+    next read after going stale. One catalog is kept per school.
+    """
+
+    def __init__(self, db, school_id, poll_interval=30, use_change_stream=True):
+        self.db = db
+        self.school_id = school_id
+        self.meta_id = f"courses:{school_id}"
+        self.poll_interval = poll_interval
+        self.use_change_stream = use_change_stream
+        self._lock = threading.Lock()
+        self._courses = None        # list of course dicts in insertion order
+        self._by_id = {}
+        self._rows = ()
+        self._version = None
+        self._stale = True
+        self._next_poll = 0.0
+        self._router = None
+
+    # Reads
+
+    def all(self):
+        """All courses as fresh dicts (safe for callers to modify)"""
+        return [dict(course) for course in self._load()]
+
+    def rows(self):
+        """All courses as immutable CourseRow records"""
+        self._load()
+        return self._rows
+
+    def get(self, course_id):
+        """One course dict by string id, or None"""
+        self._load()
+        course = self._by_id.get(str(course_id))
+        return dict(course) if course else None
+
+    def title(self, course_id, default=None):
+        self._load()
+        course = self._by_id.get(str(course_id))
+        return course['title'] if course else default
+
+    # Invalidation
+
+    def invalidate(self):
+        """Mark stale here and bump the shared version so other workers reload"""
+        self.db.meta.update_one({'_id': self.meta_id}, {'$inc': {'version': 1}}, upsert=True)
+        self._stale = True
+
+    def _load(self):
+        self._ensure_registered()
+        if not self._streaming() and time.monotonic() >= self._next_poll:
+            self._poll()
+        if self._stale or self._courses is None:
+            with self._lock:
+                if self._stale or self._courses is None:
+                    self._reload()
+        return self._courses
+
+    def _current_version(self):
+        meta = self.db.meta.find_one({'_id': self.meta_id}, {'version': 1})
+        return meta.get('version', 0) if meta else 0
+
+    def _poll(self):
+        self._next_poll = time.monotonic() + self.poll_interval
+        try:
+            if self._current_version() != self._version:
+                self._stale = True
+        except PyMongoError as e:
+            print(f"Course catalog poll failed: {e}")
+
+    def _reload(self):
+        # Clear the flag first so a change landing mid-reload marks it stale again
+        self._stale = False
+        version = self._current_version()
+        courses = list(self.db.courses.find({'school_id': self.school_id}))
+        for course in courses:
+            course['_id'] = str(course['_id'])
+        self._by_id = {course['_id']: course for course in courses}
+        self._rows = tuple(CourseRow.from_doc(course) for course in courses)
+        self._courses = courses
+        self._version = version
+        self._next_poll = time.monotonic() + self.poll_interval
+
+    # Change router listener
+
+    def _ensure_registered(self):
+        if not self.use_change_stream or self._router is not None:
+            return
+        with self._lock:
+            if self._router is None:
+                router = get_router(self.db)
+                router.register('courses', self.school_id, self)
+                self._router = router
+
+    def _streaming(self):
+        return self._router is not None and self._router.streaming
+
+    def changed(self, change):
+        self._stale = True
+
+    def stream_opened(self):
+        self._stale = True      # anything missed before the stream opened
+
+    def stream_lost(self):
+        self._stale = True
+
+    def stats(self):
+        return {
+            'courses': len(self._courses or ()),
+            'version': self._version,
+            'source': 'change_stream' if self._streaming() else 'polling',
+        }
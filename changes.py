@@ -0,0 +1,111 @@
+import threading
+import time
+from pymongo.errors import PyMongoError
+
+
+class ChangeRouter:
+    """One change stream per tenant database per worker, routed to per-school listeners.
+
+    The stream covers activity inserts and every course change for all
+    schools in the database. Each event goes to the listeners registered for
+    its collection and `fullDocument.school_id`. Course deletes carry no
+    document, so they go to every course listener. Listeners implement:
+
+        changed(change)     an event for their collection and school
+        stream_opened()     the stream (re)started; anything earlier may be missed
+        stream_lost()       the stream is down; fall back to polling
+
+    While `streaming` is False (standalone mongod, or the stream dropped)
+    listeners poll on their own. The stream is retried every `retry_interval`
+    seconds.
+    """
+
+    PIPELINE = [{'$match': {'$or': [
+        {'ns.coll': 'activities', 'operationType': 'insert'},
+        {'ns.coll': 'courses'},
+    ]}}]
+
+    def __init__(self, db, retry_interval=60):
+        self.db = db
+        self.retry_interval = retry_interval
+        self.streaming = False
+        self._listeners = {}        # (collection, school_id) -> set of listeners
+        self._lock = threading.Lock()
+        self._thread = None
+        self._events = 0
+
+    def register(self, collection, school_id, listener):
+        with self._lock:
+            self._listeners.setdefault((collection, school_id), set()).add(listener)
+            if self._thread is None:
+                # Started lazily so it runs in the gunicorn worker, not the master
+                self._thread = threading.Thread(target=self._run, name=f"changes-{self.db.name}", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                with self.db.watch(self.PIPELINE, full_document='updateLookup') as stream:
+                    self.streaming = True
+                    self._notify('stream_opened')
+                    for change in stream:
+                        self._route(change)
+            except PyMongoError as e:
+                if self.streaming:
+                    print(f"Change stream on {self.db.name} lost, polling instead: {e}")
+            if self.streaming:
+                self.streaming = False
+                self._notify('stream_lost')
+            time.sleep(self.retry_interval)
+
+    def _route(self, change):
+        self._events += 1
+        collection = change.get('ns', {}).get('coll')
+        school_id = (change.get('fullDocument') or {}).get('school_id')
+        with self._lock:
+            if school_id is None:
+                listeners = [l for (coll, _), group in self._listeners.items() if coll == collection for l in group]
+            else:
+                listeners = list(self._listeners.get((collection, school_id), ()))
+        for listener in listeners:
+            self._call(listener, 'changed', change)
+
+    def _notify(self, method):
+        with self._lock:
+            listeners = [listener for group in self._listeners.values() for listener in group]
+        for listener in listeners:
+            self._call(listener, method)
+
+    def _call(self, listener, method, *args):
+        # One failing listener must not take the stream down for every school
+        try:
+            getattr(listener, method)(*args)
+        except Exception as e:
+            print(f"Change listener {type(listener).__name__}.{method} failed: {e}")
+
+    def stats(self):
+        with self._lock:
+            schools = {school_id for _, school_id in self._listeners}
+        return {
+            'database': self.db.name,
+            'source': 'change_stream' if self.streaming else 'polling',
+            'schools': len(schools),
+            'events': self._events,
+        }
+
+
+_routers = {}
+_routers_lock = threading.Lock()
+
+
+def get_router(db):
+    """The worker's shared router for a tenant database"""
+    with _routers_lock:
+        if db.name not in _routers:
+            _routers[db.name] = ChangeRouter(db)
+        return _routers[db.name]
+
+
+def router_stats():
+    with _routers_lock:
+        return [router.stats() for router in _routers.values()]
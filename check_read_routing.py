@@ -0,0 +1,32 @@
+"""Show which replica set member serves each query class.
+
+Start a local replica set, point the app at it and run this script:
+
+    mongod --replSet rs0 --port 27017 --dbpath /tmp/rs0-0 --fork --logpath /tmp/rs0-0.log
+    mongod --replSet rs0 --port 27018 --dbpath /tmp/rs0-1 --fork --logpath /tmp/rs0-1.log
+    mongosh --port 27017 --eval 'rs.initiate({_id: "rs0", members: [
+        {_id: 0, host: "localhost:27017"}, {_id: 1, host: "localhost:27018"}]})'
+    MONGO_URI="mongodb://localhost:27017,localhost:27018/?replicaSet=rs0" MONGODB_DB=edu_tracker \\
+        python check_read_routing.py
+"""
+from config import Config
+from models import Database
+from routing import ANALYTICS, route_listener
+
+db = Database()
+client = Config.get_client()
+print(f"Primary: {client.primary}")
+print(f"Secondaries: {sorted(client.secondaries)}")
+
+# Interactive: read-your-writes page
+for student in db.get_student_rows()[:1]:
+    db.get_student(student['_id'])
+db.get_all_students()
+
+# Analytics: dashboard, search, export-style reads
+db.get_dashboard_stats()
+db.search_students('a')
+db.get_all_students(query_class=ANALYTICS)
+
+for query_class, served in route_listener.stats().items():
+    print(f"{query_class:<12} last served by {served['last_node']}  {served['nodes']}")
@@ -1,14 +1,8 @@
 import os
+import json
 from dotenv import load_dotenv
-from pymongo.mongo_client import MongoClient
-from pymongo.server_api import ServerApi
 from pathlib import Path
 from urllib.parse import quote_plus
-import dns.resolver
-
-# Configure DNS to use Google's servers
-dns.resolver.default_resolver = dns.resolver.Resolver(configure=False)
-dns.resolver.default_resolver.nameservers = ['8.8.8.8', '8.8.4.4']
 
 BASE_DIR = Path(__file__).resolve().parent
 load_dotenv(dotenv_path=BASE_DIR / '.env')
@@ -18,35 +12,134 @@ class Config:
     MONGODB_PASSWORD = os.getenv("MONGODB_PASSWORD")
     MONGODB_CLUSTER = os.getenv("MONGODB_CLUSTER")
     DB = os.getenv("MONGODB_DB")
+    # A full connection string (e.g. a local replica set) takes precedence over the Atlas parts
+    MONGO_URI = os.getenv("MONGO_URI")
+    
+    # Checked when the first connection is made (see get_client), not at
+    # import, so the app can be imported and booted before the env is complete
+    if not MONGO_URI and all([MONGODB_USERNAME, MONGODB_PASSWORD, MONGODB_CLUSTER]):
+        # URL encode credentials
+        username_encoded = quote_plus(MONGODB_USERNAME)
+        password_encoded = quote_plus(MONGODB_PASSWORD)
+        
+        # Use SRV connection string (Google DNS is configured in get_client)
+        MONGO_URI = f"mongodb+srv://{username_encoded}:{password_encoded}@{MONGODB_CLUSTER}/?retryWrites=true&w=majority&appName=Cluster0"
     
-    if not all([MONGODB_USERNAME, MONGODB_PASSWORD, MONGODB_CLUSTER, DB]):
-        raise RuntimeError("MongoDB environment variables are not set")
+    SECRET_KEY = os.getenv('SECRET_KEY', 'drivingforceofeducation')
     
-    # URL encode credentials
-    username_encoded = quote_plus(MONGODB_USERNAME)
-    password_encoded = quote_plus(MONGODB_PASSWORD)
+    # Password hashing, any Werkzeug method ('scrypt', 'scrypt:32768:8:1',
+    # 'pbkdf2:sha256:600000'). Hashes made with other parameters are upgraded at login.
+    PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 2))
+    PASSWORD_HASH_MAX_QUEUE = int(os.getenv('PASSWORD_HASH_MAX_QUEUE', 32))
+    PASSWORD_HASH_QUEUE_TIMEOUT = float(os.getenv('PASSWORD_HASH_QUEUE_TIMEOUT', 5))
+    PASSWORD_HASH_BUDGET = float(os.getenv('PASSWORD_HASH_BUDGET', 2))      # seconds one hash may take
     
-    # Use SRV connection string (with Google DNS configured above)
-    MONGO_URI = f"mongodb+srv://{username_encoded}:{password_encoded}@{MONGODB_CLUSTER}/?retryWrites=true&w=majority&appName=Cluster0"
+    # Flask-Login user cache (per worker)
+    USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', 1024))
+    USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', 300))
+    USER_CACHE_SYNC_INTERVAL = float(os.getenv('USER_CACHE_SYNC_INTERVAL', 5))
+    
+    # Course catalog cache
+    CATALOG_POLL_INTERVAL = float(os.getenv('CATALOG_POLL_INTERVAL', 30))
+    CATALOG_USE_CHANGE_STREAM = os.getenv('CATALOG_USE_CHANGE_STREAM', 'true').lower() == 'true'
+    
+    # Live dashboard feed
+    LIVE_POLL_INTERVAL = float(os.getenv('LIVE_POLL_INTERVAL', 3))
+    LIVE_STATS_INTERVAL = float(os.getenv('LIVE_STATS_INTERVAL', 5))
+    
+    # Tenancy. TENANT_DATABASES routes large schools to their own database,
+    # e.g. "district-7=edu_district7,lagos-high=edu_lagos_high".
+    DEFAULT_SCHOOL_ID = os.getenv('DEFAULT_SCHOOL_ID', 'default')
+    TENANT_DATABASES = dict(
+        pair.strip().split('=', 1)
+        for pair in os.getenv('TENANT_DATABASES', '').split(',') if '=' in pair
+    )
+    # Joining any school but the default needs an invite link from its admin
+    INVITE_TTL_DAYS = int(os.getenv('INVITE_TTL_DAYS', 14))
+    
+    # Read routing for analytics/export queries; interactive reads and writes
+    # always use the primary. MAX_STALENESS must be >= 90 seconds, or -1 for none.
+    ANALYTICS_READ_PREFERENCE = os.getenv('ANALYTICS_READ_PREFERENCE', 'secondaryPreferred')
+    ANALYTICS_MAX_STALENESS = int(os.getenv('ANALYTICS_MAX_STALENESS', -1))
+    ANALYTICS_READ_CONCERN = os.getenv('ANALYTICS_READ_CONCERN', 'local')
+    
+    # Background report worker (report_worker.py)
+    REPORT_PROCESSES = int(os.getenv('REPORT_PROCESSES', os.cpu_count() or 2))
+    REPORT_POLL_INTERVAL = float(os.getenv('REPORT_POLL_INTERVAL', 2))
+    REPORT_JOB_TIMEOUT = int(os.getenv('REPORT_JOB_TIMEOUT', 600))     # seconds without a heartbeat before a job is retried
+    REPORT_MAX_ATTEMPTS = int(os.getenv('REPORT_MAX_ATTEMPTS', 3))       # worker crashes before a job is marked failed
+    REPORT_RETENTION_DAYS = int(os.getenv('REPORT_RETENTION_DAYS', 7))   # finished jobs and their zips are then deleted
+    
+    # Token-bucket limits on hot write/auth routes: {group: {scope: "capacity/seconds"}},
+    # scopes are user, ip and global. Override with RATE_LIMITS as JSON.
+    # A whole school can sit behind one NAT address, so the ip limits are sized
+    # for a school signing in at the start of class; brute force is held back
+    # by the per-account `user` limit (keyed on the email for login).
+    RATE_LIMIT_BACKEND = os.getenv('RATE_LIMIT_BACKEND', 'mongo')     # 'mongo' (shared) or 'memory'
+    RATE_LIMITS = json.loads(os.getenv('RATE_LIMITS', 'null')) or {
+        'login': {'user': '5/60', 'ip': '600/60', 'global': '100/1'},
+        'register': {'ip': '100/300', 'global': '20/1'},
+        'log_activity': {'user': '60/60', 'ip': '1200/60', 'global': '200/1'},
+        'sync': {'user': '30/60', 'ip': '600/60', 'global': '50/1'},
+    }
+    # Number of reverse proxies in front of the app (e.g. 1 on Heroku) so the
+    # client IP is taken from X-Forwarded-For instead of the proxy's address.
+    # Left at 0 behind a proxy, every client shares the proxy's IP bucket.
+    TRUSTED_PROXIES = int(os.getenv('TRUSTED_PROXIES', 0))
+    
+    # Activities older than this are moved to monthly archives by archive.py
+    ARCHIVE_HORIZON_DAYS = int(os.getenv('ARCHIVE_HORIZON_DAYS', 365))
+    
+    # Offline device sync (/sync/activities). Pulls skip the last
+    # SYNC_SETTLE_SECONDS of writes so in-flight inserts aren't jumped over.
+    SYNC_MAX_BATCH = int(os.getenv('SYNC_MAX_BATCH', 500))
+    SYNC_PULL_LIMIT = int(os.getenv('SYNC_PULL_LIMIT', 500))
+    SYNC_SETTLE_SECONDS = float(os.getenv('SYNC_SETTLE_SECONDS', 5))
+    
+    # Startup. WARM_UP_ON_BOOT makes each gunicorn worker connect and ensure
+    # indexes before taking traffic instead of on its first request.
+    WARM_UP_ON_BOOT = os.getenv('WARM_UP_ON_BOOT', 'false').lower() == 'true'
+    STARTUP_BUDGET_MS = int(os.getenv('STARTUP_BUDGET_MS', 600))
+    # Gradebook build per 500k activities (benchmarks/bench_gradebook.py)
+    GRADEBOOK_BUDGET_MS = int(os.getenv('GRADEBOOK_BUDGET_MS', 500))
     
-    SECRET_KEY = os.getenv('SECRET_KEY', 'drivingforceofeducation')
     client = None
     
     @classmethod
     def get_client(cls):
+        """Shared MongoClient. Creating it doesn't block: pymongo connects in the background."""
         if cls.client is None:
-            print(f"Connecting to: {cls.MONGODB_CLUSTER}")
+            if not cls.DB or not cls.MONGO_URI:
+                raise RuntimeError("MongoDB environment variables are not set")
+            
+            from pymongo.mongo_client import MongoClient
+            from pymongo.server_api import ServerApi
+            from routing import route_listener
+            
+            if cls.MONGO_URI.startswith('mongodb+srv://'):
+                # Configure DNS to use Google's servers for the SRV lookup
+                import dns.resolver
+                dns.resolver.default_resolver = dns.resolver.Resolver(configure=False)
+                dns.resolver.default_resolver.nameservers = ['8.8.8.8', '8.8.4.4']
+            
+            print(f"Connecting to: {cls.MONGODB_CLUSTER or 'MONGO_URI'}")
             cls.client = MongoClient(
                 cls.MONGO_URI,
                 server_api=ServerApi('1'),
+                event_listeners=[route_listener],
                 serverSelectionTimeoutMS=30000,
                 socketTimeoutMS=30000,
                 connectTimeoutMS=30000
             )
-            try:
-                cls.client.admin.command('ping')
-                print("✓ Successfully connected to MongoDB Atlas!")
-            except Exception as e:
-                print(f"✗ Connection failed: {e}")
-                raise
         return cls.client
+    
+    @classmethod
+    def check_connection(cls):
+        """Blocking round trip to the server; for scripts and explicit warm-up"""
+        try:
+            cls.get_client().admin.command('ping')
+            print("✓ Successfully connected to MongoDB Atlas!")
+        except Exception as e:
+            print(f"✗ Connection failed: {e}")
+            raise
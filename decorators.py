@@ -1,7 +1,8 @@
-from flask import Flask, redirect, url_for, flash
+from flask import Flask, redirect, url_for, flash, request, Response
 from flask_login import LoginManager, current_user
 from functools import wraps
 from auth import User
+from ratelimit import get_limiter
 
 # ==================== DECORATORS ====================
 
@@ -30,3 +31,31 @@ def admin_required(f):
             return redirect(url_for('main.index'))
         return f(*args, **kwargs)
     return decorated_function
+
+def rate_limited(group, user_field=None):
+    """Decorator to shed POSTs with 429 once a route group's token buckets are empty.
+    
+    The user is the signed-in user, or for anonymous forms (login) the value
+    of `user_field`, so one account can't be brute-forced from many IPs.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if request.method == 'POST':
+                if current_user.is_authenticated:
+                    user = current_user.get_id()
+                elif user_field:
+                    user = (request.form.get(user_field) or '').strip().lower() or None
+                else:
+                    user = None
+                retry_after = get_limiter().check(group, user=user, ip=request.remote_addr)
+                if retry_after:
+                    return Response(
+                        'Too many requests. Please try again shortly.',
+                        status=429,
+                        headers={'Retry-After': str(retry_after)},
+                        mimetype='text/plain'
+                    )
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
@@ -0,0 +1,79 @@
+import csv
+import io
+import numpy as np
+
+
+def build_matrix(topics, student_ids, activity_topics, scores):
+    """Students x topics completion and mean-score matrices from flat activity columns.
+
+    `student_ids`, `activity_topics` and `scores` are parallel sequences, one
+    entry per activity (score may be None). Activities on topics that aren't
+    in `topics` are ignored. Returns (students, completion, mean_score) where
+    `students` is the sorted array of student ids labelling the rows,
+    `completion` is a boolean matrix and `mean_score` a float matrix with NaN
+    where a student has no scored activity on a topic.
+    """
+    n_topics = len(topics)
+    n = len(student_ids)
+    if not n or not n_topics:
+        return np.array([], dtype=str), np.zeros((0, n_topics), bool), np.zeros((0, n_topics))
+
+    # Factorise the id and topic columns with dicts: one hash lookup per
+    # activity, much cheaper than sorting an array of strings
+    first_seen = {}
+    seen_idx = np.fromiter((first_seen.setdefault(s, len(first_seen)) for s in student_ids), np.intp, count=n)
+    # Rows are labelled in sorted id order; only the distinct ids are sorted
+    students = np.asarray(sorted(first_seen), dtype=str)
+    rank = np.empty(len(students), np.intp)
+    rank[[first_seen[s] for s in students.tolist()]] = np.arange(len(students))
+    student_idx = rank[seen_idx]
+
+    columns = {}
+    for i, topic in enumerate(topics):
+        columns.setdefault(topic, i)
+    topic_idx = np.fromiter((columns.get(t, -1) for t in activity_topics), np.intp, count=n)
+    known = topic_idx >= 0
+    topic_idx = topic_idx[known]
+    student_idx = student_idx[known]
+    scores = np.fromiter((np.nan if s is None else s for s in scores), float, count=n)[known]
+
+    size = len(students) * n_topics
+    flat = student_idx * n_topics + topic_idx
+    counts = np.bincount(flat, minlength=size)
+
+    scored = ~np.isnan(scores)
+    score_sum = np.bincount(flat[scored], weights=scores[scored], minlength=size)
+    score_n = np.bincount(flat[scored], minlength=size)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_score = np.where(score_n > 0, score_sum / score_n, np.nan)
+
+    shape = (len(students), n_topics)
+    return students, counts.reshape(shape) > 0, mean_score.reshape(shape)
+
+
+def to_json(course, students, names, completion, mean_score):
+    rounded = np.round(mean_score, 1)
+    completion_rate = np.round(completion.mean(axis=1) * 100, 1) if completion.size else np.zeros(len(students))
+    return {
+        'course': {'_id': course['_id'], 'title': course['title']},
+        'topics': list(course['topics']),
+        'students': [
+            {'student_id': sid, 'name': names.get(sid, 'Unknown'), 'completion_rate': float(rate)}
+            for sid, rate in zip(students.tolist(), completion_rate.tolist())
+        ],
+        'completion': completion.astype(int).tolist(),
+        'mean_score': [[None if np.isnan(v) else v for v in row] for row in rounded.tolist()],
+    }
+
+
+def to_csv(course, students, names, completion, mean_score):
+    """One row per student: completion rate, then the mean score per topic (blank if none)"""
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(['student_id', 'name', 'completion_rate'] + list(course['topics']))
+    rounded = np.round(mean_score, 1)
+    for i, sid in enumerate(students.tolist()):
+        rate = round(float(completion[i].mean()) * 100, 1) if completion.shape[1] else 0
+        cells = ['' if np.isnan(v) else v for v in rounded[i].tolist()]
+        writer.writerow([sid, names.get(sid, 'Unknown'), rate] + cells)
+    return output.getvalue()
@@ -0,0 +1,22 @@
+import os
+
+# The app runs on threaded workers, so a CPU-heavy request (export, gradebook)
+# only holds its own thread. The dashboard event stream is served by the
+# Procfile's `stream` process with GUNICORN_WORKER_CLASS=gevent, where each
+# idle connection is a greenlet; route /dashboard/stream to it at the proxy.
+# With a single process (e.g. one Heroku web dyno) gevent also works for the
+# whole app: CPU-bound work is then run on native threads (threadpool.run_cpu).
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(os.getenv('WEB_CONCURRENCY', 2))
+threads = int(os.getenv('GUNICORN_THREADS', 8))
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 2000))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+
+
+def post_worker_init(worker):
+    # Workers boot without touching Mongo; opt in to paying the connection and
+    # index cost before accepting requests instead of on the first one.
+    from config import Config
+    if Config.WARM_UP_ON_BOOT:
+        from app import warm_up
+        warm_up()
@@ -0,0 +1,135 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import TimeoutError as FutureTimeout
+from werkzeug.security import generate_password_hash, check_password_hash
+from config import Config
+from threadpool import native_executor
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing pool is saturated and a request can't be served in time"""
+
+
+class PasswordHasher:
+    """Runs password hashing on a small, bounded thread pool.
+
+    hashlib's scrypt/pbkdf2 release the GIL, so a few threads are enough to
+    keep hashing off the request threads while capping how much CPU and
+    memory a login burst can take. Callers wait at most `queue_timeout` plus
+    `hash_budget` seconds; work still queued by then is cancelled and the
+    caller gets HashingBusy.
+    """
+
+    def __init__(self, method, max_workers=2, max_queue=32, queue_timeout=5.0, hash_budget=2.0):
+        self.method = method
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.hash_budget = hash_budget
+        # Werkzeug fills in defaults ('scrypt' -> 'scrypt:32768:8:1'), so compare
+        # stored hashes with what this method actually writes, not the setting
+        self.prefix = generate_password_hash('', method).split('$', 1)[0]
+        self._executor, self._lock = native_executor(max_workers, 'pwhash')
+        self._queued = 0
+        self._running = 0
+        self._completed = 0
+        self._rejected = 0
+        self._timed_out = 0
+        self._latencies = deque(maxlen=1000)    # seconds, hash time only
+        self._waits = deque(maxlen=1000)        # seconds spent queued
+
+    def _submit(self, fn, *args):
+        with self._lock:
+            if self._queued >= self.max_queue:
+                self._rejected += 1
+                raise HashingBusy("Too many sign-ins in progress, please try again shortly.")
+            self._queued += 1
+        enqueued = time.perf_counter()
+        future = self._executor.submit(self._run, enqueued, fn, *args)
+        try:
+            return future.result(timeout=self.queue_timeout + self.hash_budget)
+        except FutureTimeout:
+            # A job that never started is dropped; one already hashing finishes unobserved
+            cancelled = future.cancel()
+            with self._lock:
+                if cancelled:
+                    self._queued -= 1
+                self._timed_out += 1
+            raise HashingBusy("Sign-in is taking longer than usual, please try again.")
+
+    def _run(self, enqueued, fn, *args):
+        started = time.perf_counter()
+        waited = started - enqueued
+        with self._lock:
+            self._queued -= 1
+            if waited > self.queue_timeout:
+                self._timed_out += 1
+                raise HashingBusy("Sign-in is taking longer than usual, please try again.")
+            self._running += 1
+        try:
+            return fn(*args)
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self._running -= 1
+                self._completed += 1
+                self._latencies.append(elapsed)
+                self._waits.append(waited)
+
+    def generate(self, password):
+        """Hash a password with the configured method"""
+        return self._submit(generate_password_hash, password, self.method)
+
+    def check(self, pwhash, password):
+        """Check a password against a stored hash"""
+        return self._submit(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        """True if a stored hash was made with different parameters than the current method"""
+        return pwhash.split('$', 1)[0] != self.prefix
+
+    def stats(self):
+        """Latency and queue depth figures for sizing the pool"""
+        with self._lock:
+            latencies = sorted(self._latencies)
+            waits = sorted(self._waits)
+            return {
+                'method': self.prefix,
+                'max_workers': self.max_workers,
+                'max_queue': self.max_queue,
+                'queue_depth': self._queued,
+                'running': self._running,
+                'completed': self._completed,
+                'rejected': self._rejected,
+                'timed_out': self._timed_out,
+                'hash_ms': _percentiles(latencies),
+                'wait_ms': _percentiles(waits),
+            }
+
+
+def _percentiles(samples):
+    if not samples:
+        return {'p50': None, 'p95': None, 'max': None}
+    pick = lambda q: round(samples[min(len(samples) - 1, int(q * len(samples)))] * 1000, 1)
+    return {'p50': pick(0.50), 'p95': pick(0.95), 'max': round(samples[-1] * 1000, 1)}
+
+
+_hasher = None
+_hasher_lock = threading.Lock()
+
+
+def get_hasher():
+    """Process-wide hasher, created on first use (after gunicorn has forked)"""
+    global _hasher
+    if _hasher is None:
+        with _hasher_lock:
+            if _hasher is None:
+                _hasher = PasswordHasher(
+                    Config.PASSWORD_HASH_METHOD,
+                    max_workers=Config.PASSWORD_HASH_WORKERS,
+                    max_queue=Config.PASSWORD_HASH_MAX_QUEUE,
+                    queue_timeout=Config.PASSWORD_HASH_QUEUE_TIMEOUT,
+                    hash_budget=Config.PASSWORD_HASH_BUDGET,
+                )
+    return _hasher
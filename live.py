@@ -0,0 +1,199 @@
+import json
+import queue
+import threading
+import time
+from pymongo.errors import PyMongoError
+from records import ActivityRow
+from changes import get_router
+
+
+CLOSED = None     # queued for a client the feed has dropped
+
+
+class ActivityFeed:
+    """A school's new activities, fanned out to its connected SSE clients.
+
+    New activities arrive from the worker's shared change stream (see
+    changes.ChangeRouter); while it is unavailable a light thread polls for
+    documents newer than the last one seen. Each activity is pushed to every
+    connected dashboard. Dashboard counters are recomputed at most once per
+    `stats_interval` seconds and shared by all clients, so connected
+    dashboards cost nothing extra against Mongo.
+    """
+
+    def __init__(self, database, poll_interval=3, stats_interval=5, client_queue_size=100):
+        self.database = database
+        self.poll_interval = poll_interval
+        self.stats_interval = stats_interval
+        self.client_queue_size = client_queue_size
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._router = get_router(database.db)
+        self._follow_lock = threading.Lock()    # stream and poll deliveries take turns
+        self._thread = None
+        self._last_seen = None      # completed_at of the newest activity delivered
+        self._stats_due = 0.0
+        self._stats_pending = False
+
+    # Subscribers
+
+    def subscribe(self):
+        self._ensure_started()
+        client = queue.Queue(maxsize=self.client_queue_size)
+        with self._lock:
+            self._subscribers.add(client)
+        return client
+
+    def unsubscribe(self, client):
+        with self._lock:
+            self._subscribers.discard(client)
+
+    def _publish(self, event, data):
+        message = format_sse(event, data)
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for client in subscribers:
+            try:
+                client.put_nowait(message)
+            except queue.Full:
+                # Slow or dead client: drop it rather than let it hold memory
+                self._close(client)
+
+    def _close(self, client):
+        # Drop the backlog and end the client's stream, so the browser's
+        # EventSource reconnects and starts again from a fresh page
+        self.unsubscribe(client)
+        try:
+            while True:
+                client.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            client.put_nowait(CLOSED)
+        except queue.Full:
+            pass                # event_stream also notices on its next heartbeat
+
+    def subscribed(self, client):
+        with self._lock:
+            return client in self._subscribers
+
+    # Background follower
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._router.register('activities', self.database.school_id, self)
+                self._thread = threading.Thread(target=self._run, name='activity-feed', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        # Polls only while the shared change stream is down, and publishes
+        # counters. Any Mongo error is logged and retried with backoff: if this
+        # thread died, every dashboard of the school would stop updating.
+        backoff = self.poll_interval
+        while True:
+            try:
+                if self._last_seen is None:
+                    with self._follow_lock:
+                        self._last_seen = self._latest_completed_at()
+                if not self._router.streaming:
+                    self._poll()
+                self._maybe_publish_stats()
+                backoff = self.poll_interval
+                time.sleep(self.poll_interval)
+            except PyMongoError as e:
+                print(f"Activity feed error, retrying in {backoff:.0f}s: {e}")
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 60)
+
+    # Change router listener
+
+    def changed(self, change):
+        with self._follow_lock:
+            self._deliver(change['fullDocument'])
+
+    def stream_opened(self):
+        self._poll()    # catch up on anything inserted before the stream opened
+
+    def stream_lost(self):
+        pass            # _run polls while the stream is down
+
+    def _latest_completed_at(self):
+        latest = self.database.db.activities.find_one(
+            {'school_id': self.database.school_id}, {'completed_at': 1}, sort=[('completed_at', -1)]
+        )
+        return latest['completed_at'] if latest else ''
+
+    def _poll(self):
+        with self._follow_lock:
+            if self._last_seen is None:
+                self._last_seen = self._latest_completed_at()
+            new = self.database.db.activities.find(
+                {'school_id': self.database.school_id, 'completed_at': {'$gt': self._last_seen}},
+                ActivityRow.projection()
+            ).sort('completed_at', 1)
+            for doc in new:
+                self._deliver(doc)
+
+    def _deliver(self, doc):
+        row = ActivityRow.from_doc(doc)
+        if row.completed_at and row.completed_at > (self._last_seen or ''):
+            self._last_seen = row.completed_at
+        data = {field: getattr(row, field) for field in row.__slots__}
+        data['course_title'] = self.database.catalog.title(row.course_id)
+        self._publish('activity', data)
+        self._stats_pending = True
+
+    def _maybe_publish_stats(self):
+        now = time.monotonic()
+        if not self._stats_pending or now < self._stats_due or not self._subscribers:
+            return
+        self._stats_pending = False
+        self._stats_due = now + self.stats_interval
+        try:
+            self._publish('stats', self.database.get_dashboard_stats())
+        except PyMongoError as e:
+            print(f"Dashboard stats refresh failed: {e}")
+
+    def stats(self):
+        return {
+            'subscribers': len(self._subscribers),
+            'source': 'change_stream' if self._router.streaming else 'polling',
+        }
+
+
+_feeds = {}
+_feeds_lock = threading.Lock()
+
+
+def get_feed(database, **options):
+    """The worker's shared feed for a school"""
+    with _feeds_lock:
+        if database.school_id not in _feeds:
+            _feeds[database.school_id] = ActivityFeed(database, **options)
+        return _feeds[database.school_id]
+
+
+def format_sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def event_stream(feed, heartbeat=15):
+    """Generator for one SSE client; sends a comment line when idle to keep proxies open"""
+    client = feed.subscribe()
+    try:
+        yield 'retry: 5000\n\n'
+        while True:
+            try:
+                message = client.get(timeout=heartbeat)
+            except queue.Empty:
+                if not feed.subscribed(client):
+                    return
+                message = ': keep-alive\n\n'
+            if message is CLOSED:
+                return
+            yield message
+    finally:
+        feed.unsubscribe(client)
@@ -0,0 +1,120 @@
+"""One-off tenancy migration.
+
+    python migrate_tenancy.py                      # backfill school_id, swap indexes
+    python migrate_tenancy.py --move SCHOOL DB     # copy a school into its own database
+    python migrate_tenancy.py --shard              # shard tenant collections on school_id
+    python migrate_tenancy.py --add-school SCHOOL "Name"   # register a school, print an admin invite
+
+After --move, add SCHOOL=DB to TENANT_DATABASES and restart, then delete the
+school's documents from the shared database once the new one is verified.
+"""
+import sys
+from pymongo.errors import OperationFailure
+from config import Config
+from models import Database, ARCHIVE_PREFIX
+from tenancy import school_exists
+
+TENANT_COLLECTIONS = ['students', 'courses', 'activities', 'activity_summaries', 'meta']
+
+# Shard keys lead with school_id so each school's queries stay on its own
+# chunks. A sharded collection's unique indexes must start with its shard key:
+# students are unique on (school_id, email), and activities on (school_id,
+# idempotency_key), which form-logged activities leave out, so activities
+# split no further than by school. A school too big for one chunk range gets
+# its own database with --move.
+SHARD_KEYS = {
+    'students': {'school_id': 1, 'email': 1},
+    'courses': {'school_id': 1, '_id': 1},
+    'activities': {'school_id': 1},
+}
+
+
+def backfill(client):
+    db = client[Config.DB]
+    missing = {'school_id': {'$exists': False}}
+    for name in ['users', 'students', 'courses', 'activities']:
+        result = db[name].update_many(missing, {'$set': {'school_id': Config.DEFAULT_SCHOOL_ID}})
+        print(f"{name}: tagged {result.modified_count} document(s) with '{Config.DEFAULT_SCHOOL_ID}'")
+
+    # Student emails are now unique per school, not globally
+    try:
+        db.students.drop_index('email_1')
+        print("students: dropped global email index")
+    except OperationFailure:
+        pass
+
+    Database(Config.DEFAULT_SCHOOL_ID)     # creates the compound indexes
+
+    # Schools must be registered before their users can sign in
+    unknown = [s for s in db.users.distinct('school_id') if s and not school_exists(s)]
+    for school_id in unknown:
+        print(f"⚠ Users reference unregistered school '{school_id}'; add it with --add-school")
+    print("✓ Tenancy backfill complete")
+
+
+def move(client, school_id, target):
+    source = client[Config.DB]
+    destination = client[target]
+    archives = sorted(name for name in source.list_collection_names() if name.startswith(ARCHIVE_PREFIX))
+    for name in TENANT_COLLECTIONS + archives:
+        query = {'school_id': school_id} if name != 'meta' else {'_id': {'$regex': f":{school_id}$"}}
+        batch = []
+        copied = 0
+        for doc in source[name].find(query):
+            batch.append(doc)
+            if len(batch) == 1000:
+                destination[name].insert_many(batch, ordered=False)
+                copied += len(batch)
+                batch = []
+        if batch:
+            destination[name].insert_many(batch, ordered=False)
+            copied += len(batch)
+        if name in archives and copied:
+            # Same index archive.py gives every month's collection
+            destination[name].create_index([('school_id', 1), ('student_id', 1), ('completed_at', -1)])
+        print(f"{name}: copied {copied} document(s) to {target}")
+    print(f"✓ Add {school_id}={target} to TENANT_DATABASES and restart the app")
+
+
+def add_school(school_id, name):
+    Database.add_school(school_id, name)
+    token = Database.for_school(school_id).create_invite('migrate_tenancy', role='admin')
+    print(f"✓ School '{school_id}' registered")
+    print(f"First admin signs up at: /register?invite={token}")
+
+
+def has_prefix_index(collection, key):
+    """Whether an existing index starts with the fields of `key`"""
+    fields = list(key.items())
+    return any(
+        list(index['key'])[:len(fields)] == fields
+        for index in collection.index_information().values()
+    )
+
+
+def shard(client):
+    admin = client.admin
+    admin.command('enableSharding', Config.DB)
+    Database(Config.DEFAULT_SCHOOL_ID)     # the unique indexes the shard keys must fit
+    for name, key in SHARD_KEYS.items():
+        collection = client[Config.DB][name]
+        if not has_prefix_index(collection, key):
+            collection.create_index(list(key.items()))
+        admin.command('shardCollection', f"{Config.DB}.{name}", key=key)
+        print(f"{name}: sharded on {key}")
+
+
+if __name__ == '__main__':
+    client = Config.get_client()
+    args = sys.argv[1:]
+    if args[:1] == ['--move'] and len(args) == 3:
+        move(client, args[1], args[2])
+    elif args[:1] == ['--add-school'] and len(args) == 3:
+        add_school(args[1], args[2])
+    elif args == ['--shard']:
+        shard(client)
+    elif not args:
+        backfill(client)
+    else:
+        print(__doc__)
+        sys.exit(1)
@@ -1,19 +1,112 @@
+import secrets
 from config import Config
 from datetime import datetime, timezone, timedelta
 from bson import ObjectId
-from flask import jsonify, flash, render_template
-import phonenumbers
-from werkzeug.security import generate_password_hash, check_password_hash
-from flask_login import UserMixin
+from flask import flash, render_template
+from pymongo import IndexModel, UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+from hashing import HashingBusy, get_hasher
+from user_cache import user_cache, version_bump
+from catalog import CourseCatalog
+from records import StudentRow, CourseRow, ActivityRow, iter_rows
+from tenancy import database_name, school_exists, UnknownSchool
+from routing import INTERACTIVE, ANALYTICS, build_read_preference, build_read_concern
+from sync import parse_activity, encode_cursor, decode_cursor
+from threadpool import run_cpu
+
+# Monthly cold-tier collections written by archive.py
+ARCHIVE_PREFIX = 'activities_archive_'
 
 
 class Database:
-    def __init__(self):
+    """Data access for one school.
+
+    Users live in the shared directory database (login happens before the
+    school is known); students, courses and activities live in the school's
+    tenant database and every query on them is scoped by `school_id`.
+    
+    Reads take a `query_class`: INTERACTIVE reads go to the primary with the
+    writes, ANALYTICS reads go through `self.analytics` with the configured
+    read preference and read concern.
+    """
+    _instances = {}
+    
+    def __init__(self, school_id=None):
         self.client = Config.get_client()
-        self.db = self.client[Config.DB]
+        self.school_id = school_id or Config.DEFAULT_SCHOOL_ID
+        self.directory = self.client[Config.DB]
+        self.db = self.client[database_name(self.school_id)]
+        self.analytics = self.client.get_database(
+            database_name(self.school_id),
+            read_preference=build_read_preference(Config.ANALYTICS_READ_PREFERENCE, Config.ANALYTICS_MAX_STALENESS),
+            read_concern=build_read_concern(Config.ANALYTICS_READ_CONCERN)
+        )
+        
+        self.ensure_indexes()
+        
+        self.catalog = CourseCatalog(
+            self.db,
+            self.school_id,
+            poll_interval=Config.CATALOG_POLL_INTERVAL,
+            use_change_stream=Config.CATALOG_USE_CHANGE_STREAM
+        )
+    
+    def ensure_indexes(self):
+        """One createIndexes round trip per collection"""
+        self.directory.users.create_indexes([
+            IndexModel('email', unique=True),
+            IndexModel('updated_at'),
+            IndexModel([('school_id', 1), ('role', 1)])
+        ])
+        self.directory.invites.create_indexes([
+            IndexModel('expires_at', expireAfterSeconds=0),
+            IndexModel([('school_id', 1), ('created_at', -1)])
+        ])
+        self.directory.jobs.create_indexes([
+            IndexModel([('status', 1), ('created_at', 1)]),
+            IndexModel('expires_at', expireAfterSeconds=0),     # set when a job finishes
+            IndexModel([('school_id', 1), ('created_at', -1)])
+        ])
+        self.db.students.create_indexes([IndexModel([('school_id', 1), ('email', 1)], unique=True)])
+        self.db.courses.create_indexes([IndexModel([('school_id', 1), ('title', 1)])])
+        self.db.activities.create_indexes([
+            IndexModel([('school_id', 1), ('student_id', 1), ('completed_at', -1)]),
+            IndexModel([('school_id', 1), ('course_id', 1), ('completed_at', -1)]),
+            IndexModel([('school_id', 1), ('completed_at', -1)]),
+            IndexModel([('school_id', 1), ('synced_at', 1), ('_id', 1)]),
+            # Only synced activities carry a key; form-logged ones are left out
+            IndexModel(
+                [('school_id', 1), ('idempotency_key', 1)],
+                unique=True,
+                partialFilterExpression={'idempotency_key': {'$type': 'string'}}
+            )
+        ])
+        self.db.activity_summaries.create_indexes([
+            IndexModel([('school_id', 1), ('student_id', 1), ('course_id', 1)])
+        ])
+    
+    @classmethod
+    def for_school(cls, school_id):
+        """Shared instance per school, so indexes are ensured once per worker.
         
-        self.db.users.create_index('email', unique=True)
-        self.db.students.create_index('email', unique=True)
+        Only known schools get one; anything else raises UnknownSchool, so
+        made-up codes can't grow the cache or start index builds.
+        """
+        school_id = school_id or Config.DEFAULT_SCHOOL_ID
+        if school_id not in cls._instances:
+            if not school_exists(school_id):
+                raise UnknownSchool(f"Unknown school '{school_id}'")
+            cls._instances[school_id] = cls(school_id)
+        return cls._instances[school_id]
+    
+    def _reader(self, query_class):
+        return self.analytics if query_class == ANALYTICS else self.db
+    
+    def _scoped(self, query=None):
+        """Restrict a query to this school"""
+        scoped = dict(query or {})
+        scoped['school_id'] = self.school_id
+        return scoped
 
     
     # Students collection
@@ -28,8 +121,10 @@ class Database:
         if '@' not in email:
             raise ValueError("Invalid email format")
         
+        import phonenumbers     # large metadata tables; only needed here
+        
         # check for duplicate email
-        existing = self.db.students.find_one({'email': email.lower()})
+        existing = self.db.students.find_one(self._scoped({'email': email.lower()}))
         if existing:
             raise ValueError("A student with this email already exists.")
 
@@ -41,6 +136,7 @@ class Database:
             raise ValueError("Invalid phone number format")
         
         student = {
+            'school_id': self.school_id,
             'name': name.strip(),
             'email': email.strip().lower(),
             'phone_number': phone_number,
@@ -63,23 +159,58 @@ class Database:
     
     
     # Retrieve list of all students
-    def get_all_students(self):
-        students = list(self.db.students.find())
+    def get_all_students(self, query_class=INTERACTIVE):
+        students = list(self._reader(query_class).students.find(self._scoped(), comment=query_class))
         for student in students:
             student['_id'] = str(student['_id'])
         return students
     
     
+    # Compact, projected rows for list pages
+    def iter_student_rows(self, query=None, query_class=INTERACTIVE, limit=0):
+        return iter_rows(self._reader(query_class).students, StudentRow, self._scoped(query), limit=limit, comment=query_class)
+    
+    def get_student_rows(self, query=None, query_class=INTERACTIVE, limit=0):
+        return list(self.iter_student_rows(query, query_class, limit))
+    
+    
     # Retrieve details of a student
-    def get_student(self, student_id):
-        student = self.db.students.find_one({'_id': ObjectId(student_id)})
+    def get_student(self, student_id, query_class=INTERACTIVE):
+        student = self._reader(query_class).students.find_one(
+            self._scoped({'_id': ObjectId(student_id)}), comment=query_class
+        )
         if not student:
-            return jsonify({'error': f"Student {student_id} not found"})
+            return None
         
         student['_id'] = str(student['_id'])
         return student
     
     
+    def get_student_by_email(self, email):
+        student = self.db.students.find_one(self._scoped({'email': email.lower()}))
+        if student:
+            student['_id'] = str(student['_id'])
+        return student
+    
+    
+    # Search students and courses by name/title, email or description
+    def search_students(self, text):
+        return self.get_student_rows({
+            '$or': [
+                {'name': {'$regex': text, '$options': 'i'}},
+                {'email': {'$regex': text, '$options': 'i'}}
+            ]
+        }, query_class=ANALYTICS)
+    
+    def search_courses(self, text):
+        return list(self.iter_course_rows({
+            '$or': [
+                {'title': {'$regex': text, '$options': 'i'}},
+                {'description': {'$regex': text, '$options': 'i'}}
+            ]
+        }, query_class=ANALYTICS))
+    
+    
     # Courses collection
     def add_course(self, title, description, topics=None):
         if not title or not title.strip():
@@ -88,6 +219,7 @@ class Database:
             raise ValueError("Course description is required")
         
         course = {
+            'school_id': self.school_id,
             'title': title,
             'description': description,
             'topics': topics or [],
@@ -95,30 +227,31 @@ class Database:
         }
         
         result = self.db.courses.insert_one(course)
+        self.catalog.invalidate()
         return str(result.inserted_id)
     
     
-    # Retrieve the list of all courses
+    # Retrieve the list of all courses (served from the catalog cache)
     def get_all_courses(self):
-        courses = list(self.db.courses.find())
-        for course in courses:
-            course['_id'] = str(course['_id'])
-        return courses
+        return self.catalog.all()
+    
+    
+    def iter_course_rows(self, query=None, query_class=INTERACTIVE):
+        return iter_rows(self._reader(query_class).courses, CourseRow, self._scoped(query), comment=query_class)
+    
+    def get_course_rows(self):
+        return list(self.catalog.rows())
     
     
     # Retrieve a specific course
     def get_course(self, course_id):
-        course = self.db.courses.find_one({'_id': ObjectId(course_id)})
-        if not course:
-            return jsonify({"error": f"course {course['title']} not found"})
-        
-        course['_id'] = str(course['_id'])
-        return course
+        return self.catalog.get(course_id)
     
     
     # Activities collection
     def log_activity(self, student_id, course_id, activity_type, topic, score=None, notes=None):
         activity = {
+            'school_id': self.school_id,
             'student_id': student_id,
             'course_id': course_id,
             'activity_type': activity_type, # 'assignment', 'quiz', 'lesson', etc.
@@ -127,66 +260,199 @@ class Database:
             'notes': notes,
             'completed_at': datetime.now(timezone.utc).isoformat()
         }
+        activity['synced_at'] = activity['completed_at']
         
         result = self.db.activities.insert_one(activity)
         return str(result.inserted_id)
     
+    def push_activities(self, items, device_id=None):
+        """Store a batch of offline activities, once per idempotency key.
+        
+        Returns one result per item, in order: 'created', 'duplicate' (the key
+        was already stored; the first write wins) or 'rejected' with an error.
+        """
+        results = [None] * len(items)
+        parsed = []
+        for i, item in enumerate(items):
+            try:
+                parsed.append((i, parse_activity(item)))
+            except ValueError as e:
+                results[i] = {'status': 'rejected', 'error': str(e)}
+        
+        student_ids = [ObjectId(a['student_id']) for _, a in parsed if ObjectId.is_valid(a['student_id'])]
+        known_students = {
+            str(student['_id'])
+            for student in self.db.students.find(self._scoped({'_id': {'$in': student_ids}}), {'_id': 1})
+        }
+        synced_at = datetime.now(timezone.utc).isoformat()
+        ops, positions, keys = [], [], []
+        for i, activity in parsed:
+            if activity['student_id'] not in known_students:
+                results[i] = {'status': 'rejected', 'error': "Student not found"}
+            elif not self.catalog.get(activity['course_id']):
+                results[i] = {'status': 'rejected', 'error': "Course not found"}
+            else:
+                activity.update(school_id=self.school_id, device_id=device_id, synced_at=synced_at)
+                ops.append(UpdateOne(
+                    {'school_id': self.school_id, 'idempotency_key': activity['idempotency_key']},
+                    {'$setOnInsert': activity},
+                    upsert=True
+                ))
+                positions.append(i)
+                keys.append(activity['idempotency_key'])
+        if not ops:
+            return results
+        
+        try:
+            outcome = self.db.activities.bulk_write(ops, ordered=False).bulk_api_result
+        except BulkWriteError as e:
+            outcome = e.details
+        created = {upsert['index'] for upsert in outcome.get('upserted', [])}
+        errors = {
+            error['index']: error
+            for error in outcome.get('writeErrors', [])
+            if error['code'] != 11000   # a concurrent push of the same key won the insert
+        }
+        
+        ids = {
+            doc['idempotency_key']: str(doc['_id'])
+            for doc in self.db.activities.find(self._scoped({'idempotency_key': {'$in': keys}}), {'idempotency_key': 1})
+        }
+        for index, (i, key) in enumerate(zip(positions, keys)):
+            if index in errors:
+                results[i] = {'status': 'rejected', 'error': errors[index]['errmsg']}
+            else:
+                status = 'created' if index in created else 'duplicate'
+                results[i] = {'status': status, 'id': ids.get(key)}
+        return results
+    
+    def pull_activities(self, cursor=None, limit=500, course_id=None):
+        """Activities stored since `cursor`, oldest first, with the next cursor.
+        
+        Only activities older than SYNC_SETTLE_SECONDS are returned, so a write
+        still in flight can't be skipped by a cursor that has already moved past
+        its timestamp. Activities moved out by archive.py are not reported.
+        """
+        settled = (datetime.now(timezone.utc) - timedelta(seconds=Config.SYNC_SETTLE_SECONDS)).isoformat()
+        query = self._scoped({'synced_at': {'$lt': settled}})
+        if course_id:
+            query['course_id'] = course_id
+        if cursor:
+            synced_at, last_id = decode_cursor(cursor)
+            if not ObjectId.is_valid(last_id):
+                raise ValueError("Invalid sync cursor")
+            query['$or'] = [
+                {'synced_at': {'$gt': synced_at}},
+                {'synced_at': synced_at, '_id': {'$gt': ObjectId(last_id)}}
+            ]
+        
+        activities = list(
+            self.db.activities.find(query, {'school_id': 0, 'device_id': 0})
+            .sort([('synced_at', 1), ('_id', 1)])
+            .limit(limit + 1)
+        )
+        has_more = len(activities) > limit
+        activities = activities[:limit]
+        if activities:
+            cursor = encode_cursor(activities[-1]['synced_at'], activities[-1]['_id'])
+        for activity in activities:
+            activity['_id'] = str(activity['_id'])
+        return activities, cursor, has_more
+    
     
     # Check students activities
     def get_all_activities(self):
-        activities = list(self.db.activities.find().sort('completed_at', -1))
+        activities = list(self.db.activities.find(self._scoped()).sort('completed_at', -1))
         for activity in activities:
             activity['_id'] = str(activity['_id'])
         return activities
     
     
+    def iter_activity_rows(self, query=None, limit=0):
+        """Stream activities newest first as compact rows"""
+        return iter_rows(self.db.activities, ActivityRow, self._scoped(query), sort=('completed_at', -1), limit=limit)
+    
+    def get_recent_activity_rows(self, limit=10):
+        return list(self.iter_activity_rows(limit=limit))
+    
+    
     # Check a specific student activity
-    def get_student_activities(self, student_id, course_id=None):
-        query = {'student_id': student_id}
+    def get_student_activities(self, student_id, course_id=None, query_class=INTERACTIVE, include_archived=False):
+        query = self._scoped({'student_id': student_id})
         if course_id:
             query['course_id'] = course_id
         
-        activities = list(self.db.activities.find(query).sort('completed_at', -1))
+        reader = self._reader(query_class)
+        activities = list(reader.activities.find(query, comment=query_class).sort('completed_at', -1))
+        if include_archived:
+            for name in self.archive_collections():
+                activities.extend(reader[name].find(query, comment=query_class))
+            activities.sort(key=lambda activity: activity['completed_at'], reverse=True)
         for activity in activities:
             activity['_id'] = str(activity['_id'])
         return activities
+    
+    
+    def archive_collections(self):
+        """Monthly archive collections, newest first"""
+        names = [name for name in self.db.list_collection_names() if name.startswith(ARCHIVE_PREFIX)]
+        return sorted(names, reverse=True)
+    
+    
+    def get_activity_summaries(self, student_id):
+        """Per course totals for a student's archived activities"""
+        summaries = {}
+        for row in self.db.activity_summaries.find(self._scoped({'student_id': student_id})):
+            summary = summaries.setdefault(row['course_id'], {'count': 0, 'score_sum': 0, 'score_n': 0, 'last_at': None})
+            summary['count'] += row['count']
+            summary['score_sum'] += row['score_sum']
+            summary['score_n'] += row['score_n']
+            summary['last_at'] = max(filter(None, [summary['last_at'], row['last_at']]), default=None)
+        return summaries
 
 
     def get_student_progress_by_course(self, student_id):
-        """Get progress breakdown by course for a student"""
+        """Get progress breakdown by course for a student, including archived history"""
         activities = self.get_student_activities(student_id)
-        courses = self.get_all_courses()
+        archived = self.get_activity_summaries(student_id)
+        courses = self.catalog.rows()
         
         progress = []
         for course in courses:
             course_activities = [activity for activity in activities if activity['course_id'] == course['_id']]
+            summary = archived.get(course['_id'], {'count': 0, 'score_sum': 0, 'score_n': 0, 'last_at': None})
             
-            if not course_activities:
+            if not course_activities and not summary['count']:
                 continue
             
             scores = [activity['score'] for activity in course_activities if activity.get('score')]
+            score_sum = sum(scores) + summary['score_sum']
+            score_n = len(scores) + summary['score_n']
             
             progress.append({
                 'course_id': course['_id'],
                 'course_title': course['title'],
-                'total_activities': len(course_activities),
-                'average_score': round(sum(scores) / len(scores), 1) if scores else None,
-                'last_activity': course_activities[0]['completed_at'] if course_activities else None
+                'total_activities': len(course_activities) + summary['count'],
+                'average_score': round(score_sum / score_n, 1) if score_n else None,
+                'score_sum': score_sum,
+                'score_n': score_n,
+                'last_activity': course_activities[0]['completed_at'] if course_activities else summary['last_at']
             })
         return progress
 
 
     def get_course_progress(self, course_id):
         """Get all students' progress in a specific course"""
-        students = self.get_all_students()
+        students = self.get_all_students(query_class=ANALYTICS)
         course = self.get_course(course_id)
         
         if not course:
             return None
         
+        course_topics = set(course.get('topics') or [])
         progress = []
         for student in students:
-            activities = [activity for activity in self.get_student_activities(student['_id']) if activity['course_id'] == course_id]
+            activities = self.get_student_activities(student['_id'], course_id, query_class=ANALYTICS)
             
             if not activities:
                 continue
@@ -194,13 +460,9 @@ class Database:
             scores = [activity['score'] for activity in activities if activity.get('score')]
             
             # Calculate topic completion if course has topics
-            topics_completed = set()
             if course.get('topics'):
-                for activity in activities:
-                    if activity['topic'] in course['topics']:
-                        topics_completed.add(activity['topic'])
-                
-                completion_rate = (len(topics_completed) / len(course['topics']) * 100) if course['topics'] else 0
+                topics_completed = course_topics.intersection(activity['topic'] for activity in activities)
+                completion_rate = len(topics_completed) / len(course_topics) * 100
             else:
                 completion_rate = None
             
@@ -219,22 +481,63 @@ class Database:
         }
 
 
+    def get_course_gradebook(self, course_id):
+        """Students x topics completion and mean score for a course, from one projected cursor"""
+        course = self.get_course(course_id)
+        if not course:
+            return None
+        
+        cursor = self.analytics.activities.find(
+            self._scoped({'course_id': course_id}),
+            {'_id': 0, 'student_id': 1, 'topic': 1, 'score': 1},
+            batch_size=10000,
+            comment=ANALYTICS
+        )
+        student_ids, topics, scores = [], [], []
+        for activity in cursor:
+            student_ids.append(activity['student_id'])
+            topics.append(activity.get('topic') or '')
+            scores.append(activity.get('score'))
+        
+        from gradebook import build_matrix     # numpy is only loaded for gradebooks
+        students, completion, mean_score = run_cpu(build_matrix, course['topics'], student_ids, topics, scores)
+        
+        names = {
+            str(student['_id']): student['name']
+            for student in self.analytics.students.find(
+                self._scoped({'_id': {'$in': [ObjectId(sid) for sid in students.tolist() if ObjectId.is_valid(sid)]}}),
+                {'name': 1},
+                comment=ANALYTICS
+            )
+        }
+        return {
+            'course': course,
+            'students': students,
+            'names': names,
+            'completion': completion,
+            'mean_score': mean_score
+        }
+
+
     def get_dashboard_stats(self):
         """Get overall statistics for dashboard"""
-        total_students = self.db.students.count_documents({})
-        total_courses = self.db.courses.count_documents({})
-        total_activities = self.db.activities.count_documents({})
+        reader = self.analytics
+        total_students = reader.students.count_documents(self._scoped(), comment=ANALYTICS)
+        total_courses = reader.courses.count_documents(self._scoped(), comment=ANALYTICS)
+        total_activities = reader.activities.count_documents(self._scoped(), comment=ANALYTICS)
         
         # Get activities from last 7 days
         week_ago = (datetime.now(timezone.utc) - timedelta(days=7)).isoformat()
-        recent_activities = self.db.activities.count_documents({'completed_at': {'$gte': week_ago}})
+        recent_activities = reader.activities.count_documents(
+            self._scoped({'completed_at': {'$gte': week_ago}}), comment=ANALYTICS
+        )
         
         # Get average score across all activities
         pipeline = [
-            {'$match': {'score': {'$exists': True, '$ne': None}}},
+            {'$match': self._scoped({'score': {'$exists': True, '$ne': None}})},
             {'$group': {'_id': None, 'average_score': {'$avg': '$score'}}}
         ]
-        result = list(self.db.activities.aggregate(pipeline))
+        result = list(reader.activities.aggregate(pipeline, comment=ANALYTICS))
         average_score = round(result[0]['average_score'], 1) if result else 0
         
         return {
@@ -249,7 +552,7 @@ class Database:
     # ==================== USER METHODS ====================
     
     def create_user(self, email, password, name, role='teacher'):
-        """Create a new user account"""
+        """Create a new user account in this school"""
         if not email or not password or not name:
             raise ValueError('All email, password, and name are required.')
         
@@ -259,26 +562,28 @@ class Database:
             raise ValueError(f"Role must be one of: {', '.join(valid_roles)}")
         
         # Check if user exists
-        existing = self.db.users.find_one({'email': email.lower()})
+        existing = self.directory.users.find_one({'email': email.lower()})
         if existing:
             raise ValueError('A user with this email already exists.')
         
         user = {
+            'school_id': self.school_id,
             'email': email.lower(),
-            'password_hash': generate_password_hash(password),
+            'password_hash': get_hasher().generate(password),
             'name': name,
             'role': role,
             'created_at': datetime.now(timezone.utc).isoformat(),
             'is_active': True,
-            'student_id': None      # Will be set if role is a student
+            'student_id': None,     # Will be set if role is a student
+            'version': 0            # Bumped on every change, see user_cache
         }
         
-        result = self.db.users.insert_one(user)
+        result = self.directory.users.insert_one(user)
         return str(result.inserted_id)
     
     def get_user_by_email(self, email):
-        """Get user by his/her email"""
-        user = self.db.users.find_one({'email': email.lower()})
+        """Get user by his/her email (any school - used for sign-in)"""
+        user = self.directory.users.find_one({'email': email.lower()})
         if user:
             user['_id'] = str(user['_id'])
         return user
@@ -286,7 +591,7 @@ class Database:
     def get_user_by_id(self, user_id):
         """ Get user by ID"""
         try:
-            user = self.db.users.find_one({'_id': ObjectId(user_id)})
+            user = self.directory.users.find_one({'_id': ObjectId(user_id)})
             if user:
                 user['_id'] = str(user['_id'])
                 # Ensure is_active exists in the data
@@ -298,32 +603,169 @@ class Database:
             return None
 
     def verify_password(self, email, password):
-        """Verify user password"""
+        """Verify user password, upgrading the stored hash if hash parameters have changed"""
         user = self.get_user_by_email(email)
-        if user and check_password_hash(user['password_hash'], password):
+        hasher = get_hasher()
+        if user and hasher.check(user['password_hash'], password):
+            if hasher.needs_rehash(user['password_hash']):
+                # Best effort: the password was right, so the sign-in succeeds
+                # even if the upgrade has to wait for a later login
+                try:
+                    self.update_user_password(user['_id'], password)
+                except (HashingBusy, PyMongoError) as e:
+                    print(f"Password rehash skipped for {user['_id']}: {e}")
             return user
         return None
     
+    def _update_user(self, user_id, fields):
+        """Apply a change to a user and invalidate cached copies in every worker"""
+        update = version_bump()
+        update['$set'].update(fields)
+        self.directory.users.update_one({'_id': ObjectId(user_id)}, update)
+        user_cache.invalidate(user_id)
+    
     def update_user_password(self, user_id, new_password):
         """Update user password"""
-        self.db.users.update_one(
-            {'_id': ObjectId(user_id)},
-            {'$set': {'password_hash': generate_password_hash(new_password)}}
-        )
+        self._update_user(user_id, {'password_hash': get_hasher().generate(new_password)})
         
     def link_student_to_user(self, user_id, student_id):
         """Link a student profile to a user account"""
-        self.db.users.update_one(
-            {'_id': ObjectId(user_id)},
-            {'$set': {'student_id': student_id}}
-        )
+        self._update_user(user_id, {'student_id': student_id})
+    
+    def update_user_role(self, user_id, role):
+        """Change a user's role"""
+        valid_roles = ['teacher', 'student', 'parent', 'admin']
+        if role not in valid_roles:
+            raise ValueError(f"Role must be one of: {', '.join(valid_roles)}")
+        self._update_user(user_id, {'role': role})
+    
+    def set_user_active(self, user_id, is_active):
+        """Activate or deactivate a user account"""
+        self._update_user(user_id, {'is_active': bool(is_active)})
     
     def get_all_users(self):
-        """Admin retrieve profile of all users"""
-        users = list(self.db.users.find())
+        """Admin retrieve profile of all users in this school"""
+        users = list(self.directory.users.find(self._scoped()))
         for user in users:
             user['_id'] = str(user['_id'])
             user.pop('password_hash', None)
         return users
     
     
+    # ==================== SCHOOLS AND INVITES ====================
+    
+    @classmethod
+    def add_school(cls, school_id, name):
+        """Register a school so users can be invited into it"""
+        if not school_id or not name:
+            raise ValueError('A school code and name are required.')
+        directory = Config.get_client()[Config.DB]
+        if school_exists(school_id):
+            raise ValueError(f"School '{school_id}' already exists.")
+        directory.schools.insert_one({
+            '_id': school_id,
+            'name': name,
+            'created_at': datetime.now(timezone.utc).isoformat()
+        })
+        return school_id
+    
+    def create_invite(self, created_by, role='teacher', uses=1, days=None):
+        """Invite link token for joining this school with a fixed role"""
+        if role not in ['teacher', 'student', 'parent', 'admin']:
+            raise ValueError('Invalid role for an invite.')
+        if not 1 <= uses <= 500:
+            raise ValueError('An invite can be used between 1 and 500 times.')
+        now = datetime.now(timezone.utc)
+        token = secrets.token_urlsafe(24)
+        self.directory.invites.insert_one({
+            '_id': token,
+            'school_id': self.school_id,
+            'role': role,
+            'uses_left': uses,
+            'created_by': created_by,
+            'created_at': now.isoformat(),
+            'expires_at': now + timedelta(days=days or Config.INVITE_TTL_DAYS)     # TTL index
+        })
+        return token
+    
+    def list_invites(self):
+        now = datetime.now(timezone.utc)
+        return list(self.directory.invites.find(
+            self._scoped({'expires_at': {'$gt': now}, 'uses_left': {'$gt': 0}})
+        ).sort('created_at', -1))
+    
+    @classmethod
+    def get_invite(cls, token):
+        """A usable invite, or None if it doesn't exist, expired or is used up"""
+        if not token:
+            return None
+        return Config.get_client()[Config.DB].invites.find_one({
+            '_id': token,
+            'uses_left': {'$gt': 0},
+            'expires_at': {'$gt': datetime.now(timezone.utc)}
+        })
+    
+    @classmethod
+    def claim_invite(cls, token):
+        """Atomically use up one place on an invite; False if none is left"""
+        invite = Config.get_client()[Config.DB].invites.find_one_and_update(
+            {'_id': token, 'uses_left': {'$gt': 0}, 'expires_at': {'$gt': datetime.now(timezone.utc)}},
+            {'$inc': {'uses_left': -1}}
+        )
+        return invite is not None
+    
+    @classmethod
+    def release_invite(cls, token):
+        """Give back a place claimed by a registration that then failed"""
+        Config.get_client()[Config.DB].invites.update_one({'_id': token}, {'$inc': {'uses_left': 1}})
+    
+    
+    # ==================== REPORT JOBS ====================
+    
+    def create_report_job(self, created_by, course_id=None, since=None, until=None):
+        """Queue a batch of student reports for the background worker.
+        
+        Covers the whole school, or one course, optionally limited to activities
+        between `since` and `until` (inclusive, YYYY-MM-DD) for a term.
+        """
+        if course_id and not self.get_course(course_id):
+            raise ValueError("Course not found")
+        
+        params = {'course_id': course_id or None}
+        for key, value in (('since', since), ('until', until)):
+            if value:
+                try:
+                    datetime.strptime(value, '%Y-%m-%d')
+                except ValueError:
+                    raise ValueError(f"Invalid {key} date, expected YYYY-MM-DD")
+            params[key] = value or None
+        
+        job = {
+            'school_id': self.school_id,
+            'kind': 'student_reports',
+            'params': params,
+            'status': 'queued',
+            'attempts': 0,
+            'progress': {'done': 0, 'total': None},
+            'created_by': created_by,
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'file_id': None,
+            'error': None
+        }
+        result = self.directory.jobs.insert_one(job)
+        return str(result.inserted_id)
+    
+    def get_report_job(self, job_id):
+        try:
+            job = self.directory.jobs.find_one(self._scoped({'_id': ObjectId(job_id)}))
+        except Exception:
+            return None
+        if job:
+            job['_id'] = str(job['_id'])
+        return job
+    
+    def list_report_jobs(self, limit=20):
+        jobs = list(self.directory.jobs.find(self._scoped()).sort('created_at', -1).limit(limit))
+        for job in jobs:
+            job['_id'] = str(job['_id'])
+        return jobs
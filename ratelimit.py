@@ -0,0 +1,134 @@
+import math
+import threading
+import time
+from datetime import datetime, timezone, timedelta
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+from config import Config
+
+
+def parse_rate(spec):
+    """'20/60' -> (capacity 20, refill 20 tokens per 60 seconds)"""
+    capacity, seconds = spec.split('/')
+    return int(capacity), int(capacity) / float(seconds)
+
+
+class MemoryBuckets:
+    """Per-process buckets; for development or single-worker deployments"""
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, rate):
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - last) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+        return allowed, tokens
+
+
+class MongoBuckets:
+    """Buckets shared by every worker, refilled and consumed in one atomic update.
+
+    Idle buckets are removed by a TTL index on `expires_at`.
+    """
+
+    def __init__(self, collection, timeout_ms=100):
+        self.collection = collection
+        self.timeout_ms = timeout_ms
+        self.collection.create_index('expires_at', expireAfterSeconds=0)
+
+    def take(self, key, capacity, rate):
+        now = datetime.now(timezone.utc)
+        elapsed = {'$divide': [{'$subtract': [now, {'$ifNull': ['$refilled_at', now]}]}, 1000]}
+        refilled = {'$min': [capacity, {'$add': [{'$ifNull': ['$tokens', capacity]}, {'$multiply': [elapsed, rate]}]}]}
+        bucket = self.collection.find_one_and_update(
+            {'_id': key},
+            [
+                {'$set': {'tokens': refilled, 'refilled_at': now}},
+                {'$set': {'allowed': {'$gte': ['$tokens', 1]}}},
+                {'$set': {
+                    'tokens': {'$cond': ['$allowed', {'$subtract': ['$tokens', 1]}, '$tokens']},
+                    'expires_at': now + timedelta(seconds=capacity / rate)
+                }},
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+            maxTimeMS=self.timeout_ms
+        )
+        return bucket['allowed'], bucket['tokens']
+
+
+class RateLimiter:
+    """Token-bucket limits per user, per IP and globally for named route groups.
+
+    `rules` maps a group name to {scope: 'capacity/seconds'} with scopes
+    'user', 'ip' and 'global'. A request is shed as soon as any of its
+    buckets is empty. If the shared backend errors or is slow the request is
+    let through: the limiter protects the app, it must not take it down.
+    """
+
+    def __init__(self, backend, rules):
+        self.backend = backend
+        self.rules = {
+            group: {scope: parse_rate(spec) for scope, spec in scopes.items()}
+            for group, scopes in rules.items()
+        }
+        self._lock = threading.Lock()
+        self.allowed = {}
+        self.shed = {}          # "group:scope" -> requests rejected
+        self.backend_errors = 0
+
+    def check(self, group, user=None, ip=None):
+        """Return 0 if allowed, otherwise the number of seconds to wait"""
+        identities = (('user', user), ('ip', ip), ('global', 'all'))
+        for scope, identity in identities:
+            if identity is None or scope not in self.rules.get(group, {}):
+                continue
+            capacity, rate = self.rules[group][scope]
+            try:
+                allowed, tokens = self.backend.take(f"{group}:{scope}:{identity}", capacity, rate)
+            except PyMongoError:
+                with self._lock:
+                    self.backend_errors += 1
+                return 0
+            if not allowed:
+                self._count(self.shed, f"{group}:{scope}")
+                return max(1, math.ceil((1 - tokens) / rate))
+        self._count(self.allowed, group)
+        return 0
+
+    def _count(self, counters, key):
+        with self._lock:
+            counters[key] = counters.get(key, 0) + 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'allowed': dict(self.allowed),
+                'shed': dict(self.shed),
+                'backend_errors': self.backend_errors,
+            }
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter():
+    """Process-wide limiter, created on first use"""
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                if Config.RATE_LIMIT_BACKEND == 'memory':
+                    backend = MemoryBuckets()
+                else:
+                    backend = MongoBuckets(Config.get_client()[Config.DB].rate_limits)
+                _limiter = RateLimiter(backend, Config.RATE_LIMITS)
+    return _limiter
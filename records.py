@@ -0,0 +1,76 @@
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
+
+
+# Lazily-decoded documents: fields are only parsed out of the BSON buffer when accessed
+RAW_OPTIONS = CodecOptions(document_class=RawBSONDocument)
+
+
+class Row:
+    """Base for compact, read-only records built from projected Mongo documents"""
+    __slots__ = ()
+    fields = ()
+
+    def __init__(self, *values):
+        for field, value in zip(self.__slots__, values):
+            object.__setattr__(self, field, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is read-only")
+
+    def __getitem__(self, key):
+        # Lets existing dict-style code (row['name']) keep working
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def __repr__(self):
+        values = ', '.join(f"{field}={getattr(self, field)!r}" for field in self.__slots__)
+        return f"{type(self).__name__}({values})"
+
+    @classmethod
+    def projection(cls):
+        """Mongo projection for exactly the fields this row carries"""
+        return {field: 1 for field in cls.fields}
+
+    @classmethod
+    def from_doc(cls, doc):
+        """Build a row from a (raw or decoded) document"""
+        return cls(str(doc['_id']), *(doc.get(field) for field in cls.fields))
+
+
+class StudentRow(Row):
+    __slots__ = ('_id', 'name', 'email', 'phone_number')
+    fields = ('name', 'email', 'phone_number')
+
+
+class CourseRow(Row):
+    __slots__ = ('_id', 'title', 'description', 'topics')
+    fields = ('title', 'description', 'topics')
+
+    @classmethod
+    def from_doc(cls, doc):
+        # Raw BSON arrays come back as RawBSONDocument-backed lists; keep a plain tuple
+        return cls(str(doc['_id']), doc.get('title'), doc.get('description'), tuple(doc.get('topics') or ()))
+
+
+class ActivityRow(Row):
+    __slots__ = ('_id', 'student_id', 'course_id', 'activity_type', 'topic', 'score', 'notes', 'completed_at')
+    fields = ('student_id', 'course_id', 'activity_type', 'topic', 'score', 'notes', 'completed_at')
+
+
+def iter_rows(collection, row_type, query=None, sort=None, limit=0, batch_size=500, comment=None):
+    """Stream rows of `row_type` from a collection using a projected, lazily-decoded cursor"""
+    cursor = collection.with_options(codec_options=RAW_OPTIONS).find(
+        query or {}, row_type.projection(), batch_size=batch_size, comment=comment
+    )
+    if sort:
+        cursor = cursor.sort(*sort)
+    if limit:
+        cursor = cursor.limit(limit)
+    for doc in cursor:
+        yield row_type.from_doc(doc)
@@ -0,0 +1,234 @@
+"""Background worker for term-wide report jobs.
+
+Runs as its own process (see the `worker` entry in the Procfile):
+
+    python report_worker.py
+
+Jobs are queued in the `jobs` collection by the web app. The worker claims
+one at a time, loads students and their activities in batches, fans the
+workbook rendering out over a process pool and stores the zipped reports in
+GridFS for download. A job whose worker or render process dies mid-run is
+retried up to REPORT_MAX_ATTEMPTS times, then marked failed. Finished jobs and
+their zips are deleted after REPORT_RETENTION_DAYS.
+"""
+import multiprocessing
+import os
+import socket
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timezone, timedelta
+from bson import ObjectId
+from gridfs import GridFSBucket
+from pymongo import ReturnDocument
+from config import Config
+from models import Database
+from reports import render_chunk
+from routing import ANALYTICS
+
+STUDENT_BATCH = 500     # students loaded from Mongo per round trip
+CHUNK = 25              # students rendered per pool task
+
+
+def now():
+    return datetime.now(timezone.utc)
+
+
+def expires_at():
+    return now() + timedelta(days=Config.REPORT_RETENTION_DAYS)
+
+
+def claim_next_job(jobs):
+    """Atomically take the oldest queued job, or one whose worker stopped heartbeating"""
+    stale = (now() - timedelta(seconds=Config.REPORT_JOB_TIMEOUT)).isoformat()
+    # A job that keeps killing its worker (e.g. out of memory) must not block the queue
+    jobs.update_many(
+        {'status': 'running', 'heartbeat_at': {'$lt': stale}, 'attempts': {'$gte': Config.REPORT_MAX_ATTEMPTS}},
+        {'$set': {
+            'status': 'failed',
+            'error': f"Worker stopped {Config.REPORT_MAX_ATTEMPTS} times while building this report",
+            'finished_at': now().isoformat(),
+            'expires_at': expires_at()
+        }}
+    )
+    return jobs.find_one_and_update(
+        {'$or': [
+            {'status': 'queued'},
+            {'status': 'running', 'heartbeat_at': {'$lt': stale}}
+        ]},
+        {'$inc': {'attempts': 1}, '$set': {
+            'status': 'running',
+            'started_at': now().isoformat(),
+            'heartbeat_at': now().isoformat(),
+            'worker': f"{socket.gethostname()}:{os.getpid()}"
+        }},
+        sort=[('created_at', 1)],
+        return_document=ReturnDocument.AFTER
+    )
+
+
+def activity_filter(database, params):
+    query = database._scoped()
+    if params.get('course_id'):
+        query['course_id'] = params['course_id']
+    completed_at = {}
+    if params.get('since'):
+        completed_at['$gte'] = params['since']
+    if params.get('until'):
+        # Dates are inclusive; completed_at is an ISO timestamp string
+        completed_at['$lt'] = (datetime.strptime(params['until'], '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+    if completed_at:
+        query['completed_at'] = completed_at
+    return query
+
+
+def student_ids_in_scope(database, params):
+    if params.get('course_id') or params.get('since') or params.get('until'):
+        # Archived months count too: a term report can reach past the hot collection
+        query = activity_filter(database, params)
+        ids = set()
+        for name in ['activities'] + database.archive_collections():
+            ids.update(database.analytics[name].distinct('student_id', query, comment=ANALYTICS))
+    else:
+        ids = [str(student['_id']) for student in database.analytics.students.find(database._scoped(), {'_id': 1})]
+    return sorted(ids)
+
+
+def load_batch(database, params, student_ids):
+    """One query for the students, one per activity collection for all their activities"""
+    students = {
+        str(student['_id']): dict(student, _id=str(student['_id']))
+        for student in database.analytics.students.find(
+            database._scoped({'_id': {'$in': [ObjectId(sid) for sid in student_ids if ObjectId.is_valid(sid)]}}),
+            {'name': 1, 'email': 1},
+            comment=ANALYTICS
+        )
+    }
+    query = activity_filter(database, params)
+    query['student_id'] = {'$in': list(students)}
+    projection = {'_id': 0, 'student_id': 1, 'course_id': 1, 'activity_type': 1, 'topic': 1, 'score': 1, 'notes': 1, 'completed_at': 1}
+    activities = {sid: [] for sid in students}
+    # Hot collection first, then the monthly archives (newest first), so each
+    # student's list stays in descending completed_at order
+    for name in ['activities'] + database.archive_collections():
+        cursor = database.analytics[name].find(query, projection, comment=ANALYTICS).sort([('student_id', 1), ('completed_at', -1)])
+        for activity in cursor:
+            activities[activity['student_id']].append(activity)
+    return [(students[sid], activities[sid]) for sid in student_ids if sid in students]
+
+
+def run_job(job, pool, jobs, bucket):
+    database = Database.for_school(job['school_id'])
+    params = job['params']
+    student_ids = student_ids_in_scope(database, params)
+    course_titles = {course['_id']: course['title'] for course in database.catalog.rows()}
+    generated_at = now()
+    jobs.update_one({'_id': job['_id']}, {'$set': {'progress': {'done': 0, 'total': len(student_ids)}}})
+
+    done = 0
+    with tempfile.TemporaryFile() as archive_file:
+        with zipfile.ZipFile(archive_file, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for start in range(0, len(student_ids), STUDENT_BATCH):
+                batch = load_batch(database, params, student_ids[start:start + STUDENT_BATCH])
+                futures = [
+                    pool.submit(render_chunk, batch[i:i + CHUNK], course_titles, generated_at)
+                    for i in range(0, len(batch), CHUNK)
+                ]
+                for future in as_completed(futures):
+                    for filename, content in future.result():
+                        archive.writestr(filename, content)
+                        done += 1
+                    jobs.update_one(
+                        {'_id': job['_id']},
+                        {'$set': {'progress.done': done, 'heartbeat_at': now().isoformat()}}
+                    )
+
+        archive_file.seek(0)
+        filename = f"reports_{job['school_id']}_{generated_at.strftime('%Y%m%d_%H%M')}.zip"
+        retain_until = expires_at()
+        file_id = bucket.upload_from_stream(
+            filename, archive_file, metadata={'job_id': job['_id'], 'expires_at': retain_until}
+        )
+
+    jobs.update_one(
+        {'_id': job['_id']},
+        {'$set': {
+            'status': 'done', 'file_id': file_id, 'finished_at': now().isoformat(),
+            'progress.done': done, 'expires_at': retain_until
+        }}
+    )
+
+
+def delete_expired_files(bucket):
+    """GridFS has no TTL (it would orphan chunks), so old zips are deleted here"""
+    deleted = 0
+    for grid_out in bucket.find({'metadata.expires_at': {'$lt': now()}}):
+        bucket.delete(grid_out._id)
+        deleted += 1
+    if deleted:
+        print(f"Deleted {deleted} expired report file(s)")
+
+
+def new_pool():
+    # spawn, not fork: children only render workbooks and must not inherit the Mongo client
+    context = multiprocessing.get_context('spawn')
+    return ProcessPoolExecutor(max_workers=Config.REPORT_PROCESSES, mp_context=context)
+
+
+def requeue_or_fail(jobs, job, error):
+    """Put a job whose render process died back in the queue, within its attempts"""
+    if job.get('attempts', 0) < Config.REPORT_MAX_ATTEMPTS:
+        jobs.update_one({'_id': job['_id']}, {'$set': {'status': 'queued'}})
+        return
+    jobs.update_one(
+        {'_id': job['_id']},
+        {'$set': {
+            'status': 'failed',
+            'error': f"Render process died {Config.REPORT_MAX_ATTEMPTS} times: {error}",
+            'finished_at': now().isoformat(),
+            'expires_at': expires_at()
+        }}
+    )
+
+
+def main():
+    directory = Config.get_client()[Config.DB]
+    jobs = directory.jobs
+    bucket = GridFSBucket(directory, bucket_name='reports')
+    print(f"Report worker started with {Config.REPORT_PROCESSES} process(es)")
+
+    pool = new_pool()
+    next_cleanup = 0.0
+    try:
+        while True:
+            if time.monotonic() >= next_cleanup:
+                delete_expired_files(bucket)
+                next_cleanup = time.monotonic() + 3600
+            job = claim_next_job(jobs)
+            if not job:
+                time.sleep(Config.REPORT_POLL_INTERVAL)
+                continue
+            print(f"Running report job {job['_id']} for {job['school_id']}")
+            try:
+                run_job(job, pool, jobs, bucket)
+            except BrokenProcessPool as e:
+                # A render process was killed (e.g. out of memory). The pool is
+                # unusable from here on, so replace it rather than fail every
+                # later job, and retry this one if it has attempts left.
+                print(f"✗ Report job {job['_id']}: render process died, restarting the pool")
+                pool.shutdown(wait=False, cancel_futures=True)
+                pool = new_pool()
+                requeue_or_fail(jobs, job, e)
+            except Exception as e:
+                print(f"✗ Report job {job['_id']} failed: {e}")
+                jobs.update_one(
+                    {'_id': job['_id']},
+                    {'$set': {'status': 'failed', 'error': str(e), 'finished_at': now().isoformat(), 'expires_at': expires_at()}}
+                )
+    finally:
+        pool.shutdown()
+
+if __name__ == '__main__':
+    main()
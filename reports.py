@@ -0,0 +1,75 @@
+import re
+from io import BytesIO
+from datetime import datetime, timezone
+import openpyxl
+from openpyxl.styles import Font
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+def build_student_workbook(student, activities, course_titles, generated_at=None):
+    """Render one student's progress report and return the .xlsx bytes.
+
+    Takes plain data only (no database access) so it can run in a worker process.
+    """
+    generated_at = generated_at or datetime.now(timezone.utc)
+
+    # Creating workbook
+    workbook = openpyxl.Workbook()
+    worksheet = workbook.active
+    worksheet.title = "Student Report"
+
+    # Header
+    worksheet['A1'] = f"Progress Report: {student['name']}"
+    worksheet['A1'].font = Font(size=14, bold=True)
+    worksheet['A2'] = f"Email: {student['email']}"
+    worksheet['A3'] = f"Generated: {generated_at.strftime('%Y-%m-%d %H:%M')}"
+
+    # Activity table headers
+    worksheet['A5'] = "Date"
+    worksheet['B5'] = "Course"
+    worksheet['C5'] = "Type"
+    worksheet['D5'] = "Topic"
+    worksheet['E5'] = "Score"
+    worksheet['F5'] = "Notes"
+
+    for cell in ['A5', 'B5', 'C5', 'D5', 'E5', 'F5']:
+        worksheet[cell].font = Font(bold=True)
+
+    # Activities
+    row = 6
+    for activity in activities:
+        worksheet[f'A{row}'] = activity['completed_at']
+        worksheet[f'B{row}'] = course_titles.get(activity['course_id'], 'Unknown')
+        worksheet[f'C{row}'] = activity['activity_type']
+        worksheet[f'D{row}'] = activity['topic']
+        worksheet[f'E{row}'] = activity.get('score', '-')
+        worksheet[f'F{row}'] = activity.get('notes', '')
+        row += 1
+
+    # Adjust column widths
+    worksheet.column_dimensions['A'].width = 12
+    worksheet.column_dimensions['B'].width = 20
+    worksheet.column_dimensions['C'].width = 12
+    worksheet.column_dimensions['D'].width = 25
+    worksheet.column_dimensions['E'].width = 8
+    worksheet.column_dimensions['F'].width = 30
+
+    # Save to BytesIO
+    output = BytesIO()
+    workbook.save(output)
+    return output.getvalue()
+
+
+def report_filename(student):
+    """Filesystem/zip-safe name, unique per student"""
+    name = re.sub(r'[^A-Za-z0-9_-]+', '_', student['name']).strip('_') or 'student'
+    return f"{name}_{student['_id'][-6:]}_report.xlsx"
+
+
+def render_chunk(chunk, course_titles, generated_at):
+    """Render a batch of (student, activities) pairs; runs in a worker process"""
+    return [
+        (report_filename(student), build_student_workbook(student, activities, course_titles, generated_at))
+        for student, activities in chunk
+    ]
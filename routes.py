@@ -1,17 +1,33 @@
-from flask import Blueprint, render_template, send_file, request, redirect, url_for, flash, jsonify
+from flask import Blueprint, render_template, send_file, request, redirect, url_for, flash, jsonify, Response, stream_with_context
 from flask_login import login_user, logout_user, login_required, current_user
+from werkzeug.local import LocalProxy
 from models import Database
 from config import Config
 from auth import User
-from decorators import teacher_required, admin_required
-from datetime import datetime, timezone
-import openpyxl
-from openpyxl.styles import Font, Alignment
+from decorators import teacher_required, admin_required, rate_limited
+from hashing import HashingBusy, get_hasher
+from user_cache import user_cache
+from live import get_feed, event_stream
+from changes import router_stats
+from tenancy import current_school_id, UnknownSchool
+from routing import ANALYTICS, route_listener
+from ratelimit import get_limiter
+from threadpool import run_cpu
 from io import BytesIO
 
 
 bp = Blueprint('main', __name__)
-db = Database()
+# Resolves to the signed-in user's school on every access
+db = LocalProxy(lambda: Database.for_school(current_school_id()))
+
+
+def current_feed():
+    return get_feed(
+        db._get_current_object(),
+        poll_interval=Config.LIVE_POLL_INTERVAL,
+        stats_interval=Config.LIVE_STATS_INTERVAL
+    )
+
 
 # Home route
 @bp.route('/')
@@ -19,9 +35,8 @@ db = Database()
 def index():
     if current_user.is_student():
         # Student sees only their own progress
-        student = db.db.students.find_one({'email': current_user.email})
+        student = db.get_student_by_email(current_user.email)
         if student:
-            student['_id'] = str(student['_id'])
             return redirect(url_for('main.student_detail', student_id=student['_id']))
         else:
             flash('Student profile not found. Please contact your teacher.', 'warning')
@@ -29,9 +44,9 @@ def index():
     
     # Only Teacher/Admin sees full dashboard
     stats = db.get_dashboard_stats()
-    students = db.get_all_students()
-    courses = db.get_all_courses()
-    recent_activities = db.get_all_activities()[:10]
+    students = db.get_student_rows(limit=5)     # preview only; the count comes from stats
+    courses = db.get_course_rows()
+    recent_activities = db.get_recent_activity_rows(10)
     return render_template('index.html',
                            stats=stats,
                            students=students,
@@ -39,12 +54,24 @@ def index():
                            recent_activities=recent_activities)
 
 
+@bp.route('/dashboard/stream')
+@login_required
+@teacher_required
+def dashboard_stream():
+    """Server-sent events: new activities and refreshed dashboard counters"""
+    return Response(
+        stream_with_context(event_stream(current_feed())),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
 # Student routes
 @bp.route('/students')
 @login_required
 @teacher_required
 def students_list():
-    students = db.get_all_students()
+    students = db.get_student_rows()
     return render_template('students.html', students=students)
 
 @bp.route('/students/add', methods=['GET', 'POST'])
@@ -89,10 +116,10 @@ def student_detail(student_id):
     activities = db.get_student_activities(student_id)
     course_progress = db.get_student_progress_by_course(student_id)
     
-    # Calculate progress statistics
-    total_activities = len(activities)
-    quiz_scores = [activity['score'] for activity in activities if activity.get('score')]
-    average_score = sum(quiz_scores) / len(quiz_scores) if quiz_scores else 0
+    # Page totals come from the per-course figures, which include archived history
+    total_activities = sum(progress['total_activities'] for progress in course_progress)
+    score_n = sum(progress['score_n'] for progress in course_progress)
+    average_score = sum(progress['score_sum'] for progress in course_progress) / score_n if score_n else 0
     
     return render_template('student_detail.html',
                            student=student,
@@ -105,7 +132,7 @@ def student_detail(student_id):
 @bp.route('/courses')
 @login_required
 def courses_list():
-    courses = db.get_all_courses()
+    courses = db.get_course_rows()
     return render_template('courses.html', courses=courses)
 
 @bp.route('/courses/add', methods=['GET', 'POST'])
@@ -147,10 +174,32 @@ def course_detail(course_id):
 
 
 
+@bp.route('/courses/<course_id>/gradebook')
+@login_required
+@teacher_required
+def course_gradebook(course_id):
+    """Students x topics gradebook as JSON, or CSV with ?format=csv"""
+    import gradebook
+    
+    data = db.get_course_gradebook(course_id)
+    if not data:
+        return jsonify({'error': f"Course {course_id} not found"}), 404
+    
+    if request.args.get('format') == 'csv':
+        return send_file(
+            BytesIO(run_cpu(gradebook.to_csv, **data).encode('utf-8')),
+            mimetype='text/csv',
+            as_attachment=True,
+            download_name=f"{data['course']['title']}_gradebook.csv"
+        )
+    return jsonify(run_cpu(gradebook.to_json, **data))
+
+
 # Activity routes
 @bp.route('/activities/log', methods=['GET', 'POST'])
 @login_required
 @teacher_required
+@rate_limited('log_activity')
 def log_activity():
     if request.method == 'POST':
         student_id = request.form.get('student_id')
@@ -167,10 +216,44 @@ def log_activity():
         flash('Activity successfully logged', 'success')
         return redirect(url_for('main.index'))
     
-    students = db.get_all_students()
-    courses = db.get_all_courses()
+    students = db.get_student_rows()
+    courses = db.get_course_rows()
     return render_template('log_activity.html', students=students, courses=courses)
 
+# Offline device sync: POST pushes a batch, GET pulls changes since a cursor
+@bp.route('/sync/activities', methods=['GET', 'POST'])
+@login_required
+@teacher_required
+@rate_limited('sync')
+def sync_activities():
+    if request.method == 'POST':
+        payload = request.get_json(silent=True)
+        items = payload.get('activities') if isinstance(payload, dict) else None
+        if not isinstance(items, list):
+            return jsonify({'error': "Expected a JSON object with an 'activities' list"}), 400
+        if len(items) > Config.SYNC_MAX_BATCH:
+            return jsonify({'error': f"At most {Config.SYNC_MAX_BATCH} activities per push"}), 413
+        device_id = payload.get('device_id')
+        if device_id is not None and not isinstance(device_id, str):
+            return jsonify({'error': "device_id must be a string"}), 400
+
+        results = db.push_activities(items, device_id=device_id)
+        counts = {'created': 0, 'duplicate': 0, 'rejected': 0}
+        for result in results:
+            counts[result['status']] += 1
+        return jsonify({'results': results, **counts})
+
+    limit = min(request.args.get('limit', Config.SYNC_PULL_LIMIT, type=int), Config.SYNC_PULL_LIMIT)
+    try:
+        activities, cursor, has_more = db.pull_activities(
+            cursor=request.args.get('cursor') or None,
+            limit=max(1, limit),
+            course_id=request.args.get('course_id') or None
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'activities': activities, 'cursor': cursor, 'has_more': has_more})
+
 # Search query handler
 @bp.route('/search')
 @login_required
@@ -180,27 +263,8 @@ def search():
     if not query:
         return redirect(url_for('main.index'))
     
-    # Search students
-    students = db.db.students.find({
-        '$or': [
-            {'name': {'$regex': query, '$options': 'i'}},
-            {'email': {'$regex': query, '$options': 'i'}}
-        ]
-    })
-    students = list(students)
-    for s in students:
-        s['_id'] = str(s['_id'])
-    
-    # Search courses
-    courses = db.db.courses.find({
-        '$or': [
-            {'title': {'$regex': query, '$options': 'i'}},
-            {'description': {'$regex': query, '$options': 'i'}}
-        ]
-    })
-    courses = list(courses)
-    for c in courses:
-        c['_id'] = str(c['_id'])
+    students = db.search_students(query)
+    courses = db.search_courses(query)
     
     return render_template('search_results.html', 
                          query=query, 
@@ -219,106 +283,163 @@ def export_student_report(student_id):
             flash('You can only export your own report.', 'danger')
             return redirect(url_for('main.index'))
         
-    student = db.get_student(student_id)
-    activities = db.get_student_activities(student_id)
+    student = db.get_student(student_id, query_class=ANALYTICS)
+    activities = db.get_student_activities(
+        student_id,
+        query_class=ANALYTICS,
+        include_archived=request.args.get('archived') == '1'
+    )
     
     if not student:
         flash(f'Student {student_id} not found', 'danger')
         return redirect(url_for('main.students_list'))
     
-    # Creating workbook
-    workbook = openpyxl.Workbook()
-    worksheet = workbook.active
-    worksheet.title = "Student Report"
-    
-    # Header
-    worksheet['A1'] = f"Progress Report: {student['name']}"
-    worksheet['A1'].font = Font(size=14, bold=True)
-    worksheet['A2'] = f"Email: {student['email']}"
-    worksheet['A3'] = f"Generated: {datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M')}"
-    
-    # Activity table headers
-    worksheet['A5'] = "Date"
-    worksheet['B5'] = "Course"
-    worksheet['C5'] = "Type"
-    worksheet['D5'] = "Topic"
-    worksheet['E5'] = "Score"
-    worksheet['F5'] = "Notes"
+    import reports      # openpyxl is only loaded when a report is built
     
-    for cell in ['A5', 'B5', 'C5', 'D5', 'E5', 'F5']:
-        worksheet[cell].font = Font(bold=True)
+    course_titles = {course['_id']: course['title'] for course in db.catalog.rows()}
+    output = BytesIO(run_cpu(reports.build_student_workbook, student, activities, course_titles))
     
-    # Activities
-    row = 6
-    for activity in activities:
-        course = db.get_course(activity['course_id'])
-        worksheet[f'A{row}'] = activity['completed_at']
-        worksheet[f'B{row}'] = course['title'] if course else 'Unknown'
-        worksheet[f'C{row}'] = activity['activity_type']
-        worksheet[f'D{row}'] = activity['topic']
-        worksheet[f'E{row}'] = activity.get('score', '-')
-        worksheet[f'F{row}'] = activity.get('notes', '')
-        row += 1
+    return send_file(
+        output,
+        mimetype=reports.XLSX_MIMETYPE,
+        as_attachment=True,
+        download_name=f"{student['name']}_report.xlsx"
+    )
+
+
+# Term-wide report jobs (built by report_worker.py, never in a web worker)
+@bp.route('/reports', methods=['GET', 'POST'])
+@login_required
+@teacher_required
+def report_jobs():
+    if request.method == 'POST':
+        try:
+            db.create_report_job(
+                current_user.id,
+                course_id=request.form.get('course_id') or None,
+                since=request.form.get('since') or None,
+                until=request.form.get('until') or None
+            )
+            flash('Report job queued. This page will update when it is ready.', 'success')
+        except ValueError as e:
+            flash(str(e), 'danger')
+        return redirect(url_for('main.report_jobs'))
     
-    # Adjust column widths
-    worksheet.column_dimensions['A'].width = 12
-    worksheet.column_dimensions['B'].width = 20
-    worksheet.column_dimensions['C'].width = 12
-    worksheet.column_dimensions['D'].width = 25
-    worksheet.column_dimensions['E'].width = 8
-    worksheet.column_dimensions['F'].width = 30
+    jobs = db.list_report_jobs()
+    pending = any(job['status'] in ('queued', 'running') for job in jobs)
+    course_titles = {course['_id']: course['title'] for course in db.catalog.rows()}
+    return render_template('reports.html',
+                           jobs=jobs,
+                           pending=pending,
+                           courses=db.get_course_rows(),
+                           course_titles=course_titles)
+
+@bp.route('/reports/jobs/<job_id>')
+@login_required
+@teacher_required
+def report_job_status(job_id):
+    job = db.get_report_job(job_id)
+    if not job:
+        return jsonify({'error': f"Job {job_id} not found"}), 404
+    return jsonify({
+        'id': job['_id'],
+        'status': job['status'],
+        'progress': job['progress'],
+        'error': job['error'],
+        'download_url': url_for('main.report_job_download', job_id=job_id) if job['status'] == 'done' else None
+    })
+
+@bp.route('/reports/jobs/<job_id>/download')
+@login_required
+@teacher_required
+def report_job_download(job_id):
+    job = db.get_report_job(job_id)
+    if not job or job['status'] != 'done':
+        flash('That report is not ready.', 'warning')
+        return redirect(url_for('main.report_jobs'))
     
-    # Save to BytesIO
-    output = BytesIO()
-    workbook.save(output)
-    output.seek(0)
+    from gridfs import GridFSBucket
+    from gridfs.errors import NoFile
     
+    try:
+        stream = GridFSBucket(db.directory, bucket_name='reports').open_download_stream(job['file_id'])
+    except NoFile:
+        flash('That report has expired. Please generate it again.', 'warning')
+        return redirect(url_for('main.report_jobs'))
     return send_file(
-        output,
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        stream,
+        mimetype='application/zip',
         as_attachment=True,
-        download_name=f"{student['name']}_report.xlsx"
+        download_name=stream.filename
     )
 
 
 # ==================== AUTH ROUTES ====================
 
 @bp.route('/register', methods=['GET', 'POST'])
+@rate_limited('register')
 def register():
-    """User registration"""
+    """User registration.
+    
+    Without an invite, accounts join the default school. Every other school
+    is joined only through an invite link from its admin, which also fixes
+    the role.
+    """
     if current_user.is_authenticated:
         return redirect(url_for('main.index'))
     
+    token = request.values.get('invite') or None
+    invite = Database.get_invite(token)
+    if token and not invite:
+        flash('This invite link is invalid, used up or expired.', 'danger')
+        return render_template('register.html', invite=None)
+    
     if request.method == 'POST':
         try:
             email = request.form.get('email')
             password = request.form.get('password')
             confirm_password = request.form.get('confirm_password')
             name = request.form.get('name')
-            role = request.form.get('role', 'teacher')
+            if invite:
+                school_id, role = invite['school_id'], invite['role']
+            else:
+                school_id, role = Config.DEFAULT_SCHOOL_ID, request.form.get('role', 'teacher')
+                if role not in ('teacher', 'student', 'parent'):
+                    raise ValueError('Choose teacher, student or parent.')
             
             # Validation
             if password != confirm_password:
                 flash('Passwords do not match', 'danger')
-                return render_template('register.html')
+                return render_template('register.html', invite=invite)
             
             if len(password) < 6:
                 flash('Password must be at least 6 characters', 'danger')
-                return render_template('register.html')
+                return render_template('register.html', invite=invite)
+            
+            database = Database.for_school(school_id)
+            if invite and not Database.claim_invite(token):
+                flash('This invite link has just been used up.', 'danger')
+                return render_template('register.html', invite=None)
             
             # Create user
-            user_id = db.create_user(email, password, name, role)
+            try:
+                database.create_user(email, password, name, role)
+            except Exception:
+                if invite:
+                    Database.release_invite(token)
+                raise
             flash('Registration successful! Please log in.', 'success')
             return redirect(url_for('main.login'))
             
-        except ValueError as e:
+        except (ValueError, HashingBusy) as e:
             flash(str(e), 'danger')
         except Exception as e:
             flash('An error occurred during registration. Please try again.', 'danger')
     
-    return render_template('register.html')
+    return render_template('register.html', invite=invite)
 
 @bp.route('/login', methods=['GET', 'POST'])
+@rate_limited('login', user_field='email')
 def login():
     """User login"""
     if current_user.is_authenticated:
@@ -329,7 +450,11 @@ def login():
         password = request.form.get('password')
         remember = request.form.get('remember', False)
         
-        user_data = db.verify_password(email, password)
+        try:
+            user_data = db.verify_password(email, password)
+        except HashingBusy as e:
+            flash(str(e), 'warning')
+            return render_template('login.html'), 503
         
         if user_data:
             user = User(user_data)
@@ -371,7 +496,11 @@ def change_password():
         confirm_password = request.form.get('confirm_password')
         
         # Verify current password
-        user_data = db.verify_password(current_user.email, current_password)
+        try:
+            user_data = db.verify_password(current_user.email, current_password)
+        except HashingBusy as e:
+            flash(str(e), 'warning')
+            return render_template('change_password.html'), 503
         if not user_data:
             flash('Current password is incorrect', 'danger')
             return render_template('change_password.html')
@@ -386,8 +515,60 @@ def change_password():
             return render_template('change_password.html')
         
         # Update password
-        db.update_user_password(current_user.id, new_password)
+        try:
+            db.update_user_password(current_user.id, new_password)
+        except HashingBusy as e:
+            flash(str(e), 'warning')
+            return render_template('change_password.html'), 503
         flash('Password changed successfully!', 'success')
         return redirect(url_for('main.profile'))
     
     return render_template('change_password.html')
+
+
+# ==================== SCHOOL ADMIN ====================
+
+@bp.route('/admin/invites', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def invites():
+    """Invite links for joining the admin's school"""
+    if request.method == 'POST':
+        try:
+            token = db.create_invite(
+                current_user.id,
+                role=request.form.get('role', 'teacher'),
+                uses=request.form.get('uses', 1, type=int)
+            )
+            flash(f"Invite link: {url_for('main.register', invite=token, _external=True)}", 'success')
+        except ValueError as e:
+            flash(str(e), 'danger')
+        return redirect(url_for('main.invites'))
+    
+    return render_template('invites.html', invites=db.list_invites())
+
+
+@bp.app_errorhandler(UnknownSchool)
+def unknown_school(e):
+    # A session whose school has been removed (or was never registered)
+    logout_user()
+    flash('Your school is not registered. Please contact your administrator.', 'danger')
+    return redirect(url_for('main.login'))
+
+
+# ==================== OPERATIONS ====================
+
+@bp.route('/admin/metrics')
+@login_required
+@admin_required
+def metrics():
+    """Per-worker runtime figures for capacity planning"""
+    return jsonify({
+        'hashing': get_hasher().stats(),
+        'user_cache': user_cache.stats(),
+        'course_catalog': db.catalog.stats(),
+        'live_feed': current_feed().stats(),
+        'change_streams': router_stats(),
+        'query_routing': route_listener.stats(),
+        'rate_limits': get_limiter().stats(),
+    })
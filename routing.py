@@ -0,0 +1,78 @@
+import threading
+from pymongo import monitoring
+from pymongo.read_concern import ReadConcern
+from pymongo.read_preferences import Primary, PrimaryPreferred, Secondary, SecondaryPreferred, Nearest
+
+# Query classes. Interactive covers writes and pages that must see their own
+# writes; analytics covers dashboards, progress reports, search and exports,
+# which can tolerate replication lag.
+INTERACTIVE = 'interactive'
+ANALYTICS = 'analytics'
+
+_READ_PREFERENCES = {
+    'primary': Primary,
+    'primaryPreferred': PrimaryPreferred,
+    'secondary': Secondary,
+    'secondaryPreferred': SecondaryPreferred,
+    'nearest': Nearest,
+}
+
+
+def build_read_preference(name, max_staleness=-1):
+    """Read preference from its connection-string name, e.g. 'secondaryPreferred'"""
+    if name not in _READ_PREFERENCES:
+        raise ValueError(f"Unknown read preference: {name}")
+    if name == 'primary':
+        return Primary()
+    return _READ_PREFERENCES[name](max_staleness=max_staleness)
+
+
+def build_read_concern(level):
+    return ReadConcern(level or None)
+
+
+class QueryRouteListener(monitoring.CommandListener):
+    """Records which server answered each query class.
+
+    Queries are tagged with their class through the command `comment`, which
+    also makes them easy to pick out in the server's slow query log.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}      # request_id -> query class
+        self._served = {}       # query class -> {"host:port": count}
+        self._last = {}         # query class -> "host:port"
+
+    def started(self, event):
+        query_class = event.command.get('comment')
+        if query_class in (INTERACTIVE, ANALYTICS):
+            with self._lock:
+                self._pending[event.request_id] = query_class
+
+    def succeeded(self, event):
+        self._record(event)
+
+    def failed(self, event):
+        with self._lock:
+            self._pending.pop(event.request_id, None)
+
+    def _record(self, event):
+        with self._lock:
+            query_class = self._pending.pop(event.request_id, None)
+            if query_class is None:
+                return
+            node = '%s:%s' % event.connection_id
+            counts = self._served.setdefault(query_class, {})
+            counts[node] = counts.get(node, 0) + 1
+            self._last[query_class] = node
+
+    def stats(self):
+        with self._lock:
+            return {
+                query_class: {'last_node': self._last.get(query_class), 'nodes': dict(counts)}
+                for query_class, counts in self._served.items()
+            }
+
+
+route_listener = QueryRouteListener()
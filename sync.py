@@ -0,0 +1,105 @@
+"""Delta sync for devices that record activities offline.
+
+Devices push batches of activities, each carrying a client-generated
+`idempotency_key`; replaying a batch never creates duplicates. They pull
+everything that changed since an opaque cursor returned by the previous pull.
+
+Activities logged before sync existed have no `synced_at` and are invisible to
+pulls until backfilled once, before devices start syncing:
+
+    python sync.py --backfill
+"""
+import base64
+import json
+import sys
+from datetime import datetime, timezone
+
+MAX_KEY_LENGTH = 128
+
+
+def encode_cursor(synced_at, activity_id):
+    """Opaque token for the position after (synced_at, _id)"""
+    raw = json.dumps([synced_at, str(activity_id)], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        synced_at, activity_id = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid sync cursor")
+    if not isinstance(synced_at, str) or not isinstance(activity_id, str):
+        raise ValueError("Invalid sync cursor")
+    return synced_at, activity_id
+
+
+def parse_timestamp(value):
+    """ISO 8601 from a device -> UTC isoformat as stored in `completed_at`"""
+    try:
+        moment = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except (AttributeError, ValueError):
+        raise ValueError("completed_at must be an ISO 8601 timestamp")
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    moment = moment.astimezone(timezone.utc)
+    if moment > datetime.now(timezone.utc):
+        raise ValueError("completed_at is in the future")
+    return moment.isoformat()
+
+
+def parse_activity(item):
+    """Validate one pushed activity and return the fields to store"""
+    if not isinstance(item, dict):
+        raise ValueError("Activity must be an object")
+
+    key = item.get('idempotency_key')
+    if not isinstance(key, str) or not key.strip() or len(key) > MAX_KEY_LENGTH:
+        raise ValueError(f"idempotency_key must be a non-empty string of at most {MAX_KEY_LENGTH} characters")
+
+    activity = {'idempotency_key': key.strip()}
+    for field in ('student_id', 'course_id', 'activity_type', 'topic'):
+        value = item.get(field)
+        if not isinstance(value, str) or not value.strip():
+            raise ValueError(f"{field} is required")
+        activity[field] = value.strip()
+
+    score = item.get('score')
+    if score is not None:
+        if isinstance(score, bool) or not isinstance(score, (int, float)):
+            raise ValueError("score must be a whole number")
+        if isinstance(score, float) and not score.is_integer():
+            raise ValueError("score must be a whole number")
+    activity['score'] = int(score) if score is not None else None
+
+    notes = item.get('notes')
+    if notes is not None and not isinstance(notes, str):
+        raise ValueError("notes must be a string")
+    activity['notes'] = notes or None
+
+    completed_at = item.get('completed_at')
+    activity['completed_at'] = parse_timestamp(completed_at) if completed_at else datetime.now(timezone.utc).isoformat()
+    return activity
+
+
+def backfill(database):
+    """Give activities logged before sync existed a `synced_at` from their completion time"""
+    result = database.db.activities.update_many(
+        database._scoped({'synced_at': {'$exists': False}}),
+        [{'$set': {'synced_at': '$completed_at'}}]
+    )
+    return result.modified_count
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] != ['--backfill']:
+        print(__doc__)
+        sys.exit(1)
+
+    from models import Database
+    from archive import all_schools
+
+    for school_id in all_schools():
+        updated = backfill(Database.for_school(school_id))
+        print(f"{school_id}: backfilled {updated} activities")
+    print("✓ Sync backfill complete")
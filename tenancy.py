@@ -0,0 +1,31 @@
+from flask import has_request_context
+from flask_login import current_user
+from config import Config
+
+
+def database_name(school_id):
+    """Database holding a school's students, courses and activities.
+
+    Large schools can be given their own database through TENANT_DATABASES;
+    everyone else shares the default one, partitioned by `school_id`.
+    """
+    return Config.TENANT_DATABASES.get(school_id, Config.DB)
+
+
+def current_school_id():
+    """School of the signed-in user, or the default school outside a session"""
+    if has_request_context() and current_user.is_authenticated:
+        return current_user.school_id
+    return Config.DEFAULT_SCHOOL_ID
+
+
+class UnknownSchool(ValueError):
+    """Raised for a school code that hasn't been registered"""
+
+
+def school_exists(school_id):
+    """Known schools: the default, those with their own database, and the `schools` collection"""
+    if school_id == Config.DEFAULT_SCHOOL_ID or school_id in Config.TENANT_DATABASES:
+        return True
+    directory = Config.get_client()[Config.DB]
+    return directory.schools.find_one({'_id': school_id}, {'_id': 1}) is not None
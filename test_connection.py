@@ -1,6 +1,8 @@
+from config import Config
 from models import Database
 
 
+Config.check_connection()
 db = Database()
 print("✓ Connected to MongoDB!")
 
@@ -0,0 +1,358 @@
+"""Offline sync: activity validation, cursors, and push/pull result mapping.
+
+Push and pull run against a small in-memory collection that understands the
+handful of query operators they use, so no MongoDB server is needed.
+"""
+from datetime import datetime, timezone, timedelta
+
+import pytest
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+
+from config import Config
+from models import Database
+from sync import parse_activity, encode_cursor, decode_cursor
+
+SCHOOL = 'school-a'
+COURSE = 'course-1'
+
+
+# ==================== TEST DOUBLES ====================
+
+def matches(doc, query):
+    for field, condition in query.items():
+        if field == '$or':
+            if not any(matches(doc, branch) for branch in condition):
+                return False
+            continue
+        value = doc.get(field)
+        if isinstance(condition, dict):
+            for op, operand in condition.items():
+                if op == '$in' and value not in operand:
+                    return False
+                if op == '$lt' and not (value is not None and value < operand):
+                    return False
+                if op == '$gt' and not (value is not None and value > operand):
+                    return False
+        elif value != condition:
+            return False
+    return True
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, keys):
+        for field, direction in reversed(keys):
+            self.docs.sort(key=lambda doc: doc[field], reverse=direction < 0)
+        return self
+
+    def limit(self, n):
+        self.docs = self.docs[:n]
+        return self
+
+    def __iter__(self):
+        return iter(self.docs)
+
+
+class FakeCollection:
+    def __init__(self, docs=()):
+        self.docs = [dict(doc) for doc in docs]
+        self.bulk_calls = []
+
+    def find(self, query, projection=None):
+        found = [dict(doc) for doc in self.docs if matches(doc, query)]
+        if projection and all(v == 0 for v in projection.values()):
+            for doc in found:
+                for field in projection:
+                    doc.pop(field, None)
+        return FakeCursor(found)
+
+    def bulk_write(self, ops, ordered=True):
+        """Upserts with $setOnInsert, unique on the filter (school_id, idempotency_key)"""
+        self.bulk_calls.append(ops)
+        upserted = []
+        for index, op in enumerate(ops):
+            doc = op._doc
+            if not any(matches(existing, op._filter) for existing in self.docs):
+                inserted = dict(doc['$setOnInsert'], _id=ObjectId())
+                self.docs.append(inserted)
+                upserted.append({'index': index, '_id': inserted['_id']})
+        return type('Result', (), {'bulk_api_result': {'upserted': upserted, 'writeErrors': []}})()
+
+
+class FakeCatalog:
+    def get(self, course_id):
+        return {'_id': course_id} if course_id == COURSE else None
+
+
+class FakeDb:
+    def __init__(self, students=(), activities=()):
+        self.students = FakeCollection(students)
+        self.activities = FakeCollection(activities)
+
+
+def make_database(activities=(), student_ids=()):
+    database = Database.__new__(Database)
+    database.school_id = SCHOOL
+    database.db = FakeDb(
+        students=[{'_id': sid, 'school_id': SCHOOL} for sid in student_ids],
+        activities=activities
+    )
+    database.catalog = FakeCatalog()
+    return database
+
+
+def activity(key, student_id, **fields):
+    return dict({
+        'idempotency_key': key,
+        'student_id': str(student_id),
+        'course_id': COURSE,
+        'activity_type': 'quiz',
+        'topic': 'Fractions',
+        'score': 80,
+    }, **fields)
+
+
+def iso(seconds_ago):
+    return (datetime.now(timezone.utc) - timedelta(seconds=seconds_ago)).isoformat()
+
+
+# ==================== parse_activity ====================
+
+def test_parse_activity_normalises_fields():
+    parsed = parse_activity(activity(' k1 ', 'abc', topic=' Fractions ', notes='', completed_at='2026-01-05T10:00:00Z'))
+    assert parsed['idempotency_key'] == 'k1'
+    assert parsed['topic'] == 'Fractions'
+    assert parsed['notes'] is None
+    assert parsed['completed_at'] == '2026-01-05T10:00:00+00:00'
+
+
+def test_parse_activity_converts_offsets_and_naive_times_to_utc():
+    assert parse_activity(activity('k', 'a', completed_at='2026-01-05T11:00:00+01:00'))['completed_at'] == '2026-01-05T10:00:00+00:00'
+    assert parse_activity(activity('k', 'a', completed_at='2026-01-05T10:00:00'))['completed_at'] == '2026-01-05T10:00:00+00:00'
+
+
+def test_parse_activity_defaults_completed_at_to_now():
+    before = datetime.now(timezone.utc).isoformat()
+    assert parse_activity(activity('k', 'a'))['completed_at'] >= before
+
+
+def test_parse_activity_accepts_whole_float_scores_and_no_score():
+    assert parse_activity(activity('k', 'a', score=75.0))['score'] == 75
+    assert parse_activity(activity('k', 'a', score=None))['score'] is None
+
+
+@pytest.mark.parametrize('item, message', [
+    ('not a dict', 'must be an object'),
+    (activity(None, 'a'), 'idempotency_key'),
+    (activity('   ', 'a'), 'idempotency_key'),
+    (activity('k' * 129, 'a'), 'idempotency_key'),
+    (activity(42, 'a'), 'idempotency_key'),
+    (activity('k', ''), 'student_id'),
+    (activity('k', 'a', course_id=None), 'course_id'),
+    (activity('k', 'a', score=True), 'score'),
+    (activity('k', 'a', score=1.5), 'score'),
+    (activity('k', 'a', score='80'), 'score'),
+    (activity('k', 'a', score=float('nan')), 'score'),
+    (activity('k', 'a', notes=5), 'notes'),
+    (activity('k', 'a', completed_at='yesterday'), 'completed_at'),
+    (activity('k', 'a', completed_at=iso(-3600)), 'future'),
+])
+def test_parse_activity_rejects_invalid_items(item, message):
+    with pytest.raises(ValueError, match=message):
+        parse_activity(item)
+
+
+# ==================== cursors ====================
+
+def test_cursor_round_trip_is_url_safe():
+    activity_id = ObjectId()
+    token = encode_cursor('2026-01-05T10:00:00.123456+00:00', activity_id)
+    assert '=' not in token and '+' not in token and '/' not in token
+    assert decode_cursor(token) == ('2026-01-05T10:00:00.123456+00:00', str(activity_id))
+
+
+@pytest.mark.parametrize('token', ['garbage!', '', encode_cursor('x', 'y')[:-3], 'WzEsMl0'])
+def test_decode_cursor_rejects_bad_tokens(token):
+    # 'WzEsMl0' is [1,2]: valid JSON, wrong types
+    with pytest.raises(ValueError, match='Invalid sync cursor'):
+        decode_cursor(token)
+
+
+# ==================== push ====================
+
+def test_push_reports_created_then_duplicate_on_replay():
+    student = ObjectId()
+    database = make_database(student_ids=[student])
+    batch = [activity('k1', student), activity('k2', student, completed_at='2026-01-05T10:00:00Z')]
+
+    first = database.push_activities(batch, device_id='tablet-7')
+    assert [r['status'] for r in first] == ['created', 'created']
+    assert len(database.db.activities.docs) == 2
+
+    replay = database.push_activities(batch, device_id='tablet-7')
+    assert [r['status'] for r in replay] == ['duplicate', 'duplicate']
+    assert [r['id'] for r in replay] == [r['id'] for r in first]
+    assert len(database.db.activities.docs) == 2
+
+
+def test_push_stores_scoped_documents_with_one_synced_at():
+    student = ObjectId()
+    database = make_database(student_ids=[student])
+    database.push_activities([activity('k1', student), activity('k2', student)], device_id='tablet-7')
+
+    (ops,) = database.db.activities.bulk_calls
+    assert all(op._filter == {'school_id': SCHOOL, 'idempotency_key': key} for op, key in zip(ops, ['k1', 'k2']))
+    assert all(op._upsert and list(op._doc) == ['$setOnInsert'] for op in ops)
+    stored = database.db.activities.docs
+    assert {doc['school_id'] for doc in stored} == {SCHOOL}
+    assert {doc['device_id'] for doc in stored} == {'tablet-7'}
+    assert len({doc['synced_at'] for doc in stored}) == 1
+
+
+def test_push_keeps_item_order_with_rejections():
+    student = ObjectId()
+    database = make_database(student_ids=[student])
+    results = database.push_activities([
+        activity('k1', student),
+        {'idempotency_key': 'k2'},
+        activity('k3', ObjectId()),
+        activity('k4', 'not-an-id'),
+        activity('k5', student, course_id='course-unknown'),
+        activity('k6', student),
+    ])
+    assert [r['status'] for r in results] == ['created', 'rejected', 'rejected', 'rejected', 'rejected', 'created']
+    assert results[1]['error'] == 'student_id is required'
+    assert results[2]['error'] == results[3]['error'] == 'Student not found'
+    assert results[4]['error'] == 'Course not found'
+
+
+def test_push_with_nothing_valid_skips_the_write():
+    database = make_database()
+    results = database.push_activities([{'idempotency_key': 'k1'}, activity('k2', ObjectId())])
+    assert [r['status'] for r in results] == ['rejected', 'rejected']
+    assert database.db.activities.bulk_calls == []
+
+
+def test_push_maps_concurrent_duplicate_key_errors_to_duplicate():
+    student = ObjectId()
+    existing = {'_id': ObjectId(), 'school_id': SCHOOL, 'idempotency_key': 'k2'}
+    database = make_database(student_ids=[student], activities=[existing])
+    created_id = ObjectId()
+
+    def bulk_write(ops, ordered=True):
+        # Another device's push of k2 won the insert; k3 failed validation server-side
+        assert ordered is False
+        database.db.activities.docs.append({'_id': created_id, 'school_id': SCHOOL, 'idempotency_key': 'k1'})
+        raise BulkWriteError({
+            'upserted': [{'index': 0, '_id': created_id}],
+            'writeErrors': [
+                {'index': 1, 'code': 11000, 'errmsg': 'E11000 duplicate key error'},
+                {'index': 2, 'code': 121, 'errmsg': 'Document failed validation'},
+            ],
+        })
+    database.db.activities.bulk_write = bulk_write
+
+    results = database.push_activities([activity('k1', student), activity('k2', student), activity('k3', student)])
+    assert results[0] == {'status': 'created', 'id': str(created_id)}
+    assert results[1] == {'status': 'duplicate', 'id': str(existing['_id'])}
+    assert results[2] == {'status': 'rejected', 'error': 'Document failed validation'}
+
+
+def test_idempotency_keys_are_unique_per_school():
+    created = {}
+
+    class Recorder:
+        def __init__(self, name):
+            self.name = name
+
+        def create_indexes(self, models):
+            created[self.name] = [model.document for model in models]
+
+    class Namespace:
+        def __getattr__(self, name):
+            return Recorder(name)
+
+    database = make_database()
+    database.directory, database.db = Namespace(), Namespace()
+    database.ensure_indexes()
+
+    (index,) = [i for i in created['activities'] if 'idempotency_key' in i['key']]
+    assert list(index['key'].items()) == [('school_id', 1), ('idempotency_key', 1)]
+    assert index['unique'] is True
+    # Form-logged activities have no key and must not collide on null
+    assert index['partialFilterExpression'] == {'idempotency_key': {'$type': 'string'}}
+
+
+# ==================== pull ====================
+
+def synced(seconds_ago, _id=None, **fields):
+    return dict({'_id': _id or ObjectId(), 'school_id': SCHOOL, 'course_id': COURSE, 'synced_at': iso(seconds_ago)}, **fields)
+
+
+def pull_all(database, limit, **options):
+    pages, cursor = [], None
+    while True:
+        activities, cursor, has_more = database.pull_activities(cursor=cursor, limit=limit, **options)
+        pages.append([a['_id'] for a in activities])
+        if not has_more:
+            return pages, cursor
+
+
+def test_pull_pages_in_order_and_breaks_synced_at_ties_on_id():
+    tied_at = iso(60)
+    ids = sorted(ObjectId() for _ in range(3))
+    docs = [
+        synced(120),
+        {'_id': ids[2], 'school_id': SCHOOL, 'synced_at': tied_at},
+        {'_id': ids[0], 'school_id': SCHOOL, 'synced_at': tied_at},
+        {'_id': ids[1], 'school_id': SCHOOL, 'synced_at': tied_at},
+        synced(30),
+    ]
+    database = make_database(activities=docs)
+
+    pages, _ = pull_all(database, limit=2)
+    flat = [_id for page in pages for _id in page]
+    assert flat == [str(docs[0]['_id'])] + [str(i) for i in ids] + [str(docs[4]['_id'])]
+    assert [len(page) for page in pages] == [2, 2, 1]
+
+
+def test_pull_leaves_out_the_settle_window_until_it_passes(monkeypatch):
+    monkeypatch.setattr(Config, 'SYNC_SETTLE_SECONDS', 5)
+    old, recent = synced(60), synced(1)
+    database = make_database(activities=[old, recent])
+
+    activities, cursor, has_more = database.pull_activities()
+    assert [a['_id'] for a in activities] == [str(old['_id'])]
+    assert has_more is False
+
+    database.db.activities.docs[1]['synced_at'] = iso(10)   # as if the settle window has now passed
+    activities, _, _ = database.pull_activities(cursor=cursor)
+    assert [a['_id'] for a in activities] == [str(recent['_id'])]
+
+
+def test_pull_with_nothing_new_returns_the_same_cursor():
+    database = make_database(activities=[synced(60)])
+    _, cursor, _ = database.pull_activities()
+    activities, again, has_more = database.pull_activities(cursor=cursor)
+    assert activities == [] and again == cursor and has_more is False
+
+
+def test_pull_is_scoped_to_the_school_and_course_and_hides_internal_fields():
+    mine = synced(60, device_id='tablet-7')
+    database = make_database(activities=[
+        mine,
+        synced(60, school_id='school-b'),
+        synced(60, course_id='course-2'),
+    ])
+    activities, _, _ = database.pull_activities(course_id=COURSE)
+    assert [a['_id'] for a in activities] == [str(mine['_id'])]
+    assert 'school_id' not in activities[0] and 'device_id' not in activities[0]
+
+
+@pytest.mark.parametrize('cursor', ['garbage!', encode_cursor(iso(60), 'not-an-object-id')])
+def test_pull_rejects_invalid_cursors(cursor):
+    with pytest.raises(ValueError, match='Invalid sync cursor'):
+        make_database().pull_activities(cursor=cursor)
@@ -0,0 +1,47 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+def gevent_active():
+    try:
+        from gevent import monkey
+        return monkey.is_module_patched('threading')
+    except ImportError:
+        return False
+
+
+def native_executor(max_workers, name):
+    """Native threads and a real lock, even when gunicorn runs gevent workers.
+
+    Under gevent, threading is monkey-patched into greenlets, which would run
+    the work on the event loop and stall every connection in the worker. The
+    hub's native thread pool is used instead, with a real (unpatched) lock
+    for counters shared with those threads.
+    """
+    if gevent_active():
+        from gevent import monkey
+        from gevent.threadpool import ThreadPoolExecutor as NativeThreadPoolExecutor
+        native_lock = monkey.get_original('threading', 'Lock')
+        return NativeThreadPoolExecutor(max_workers=max_workers), native_lock()
+    return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name), threading.Lock()
+
+
+_cpu_executor = None
+_cpu_lock = threading.Lock()
+
+
+def run_cpu(fn, *args, **kwargs):
+    """Call pure-CPU work (no Mongo or sockets) without blocking a gevent worker.
+
+    On sync/gthread workers this is a plain call. Under gevent the work runs on
+    a native thread while the calling greenlet waits, so other connections in
+    the worker keep being served.
+    """
+    global _cpu_executor
+    if not gevent_active():
+        return fn(*args, **kwargs)
+    if _cpu_executor is None:
+        with _cpu_lock:
+            if _cpu_executor is None:
+                _cpu_executor, _ = native_executor(4, 'cpu')
+    return _cpu_executor.submit(fn, *args, **kwargs).result()
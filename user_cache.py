@@ -0,0 +1,120 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone, timedelta
+from config import Config
+
+
+class UserCache:
+    """In-process TTL + LRU cache of user documents for Flask-Login.
+
+    Every change to a user ($inc on the user's `version`, `updated_at` set)
+    is picked up by other gunicorn workers through a periodic sync: at most
+    once per `sync_interval` seconds a worker asks Mongo which users changed
+    since its last sync and drops any cached entry with an older version.
+    Changes made in this worker are invalidated immediately.
+    """
+
+    # Overlap between sync windows to absorb clock skew between app servers
+    SYNC_SKEW = timedelta(seconds=2)
+
+    def __init__(self, maxsize=1024, ttl=300, sync_interval=5):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.sync_interval = sync_interval
+        self._entries = OrderedDict()   # user_id -> (expires_at, version, user_data)
+        self._lock = threading.Lock()
+        self._last_sync = None          # datetime of the last successful sync
+        self._next_sync = 0.0           # monotonic deadline for the next sync
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id, db):
+        """Return user data for `user_id`, loading through `db` on a miss"""
+        self._maybe_sync(db)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry and entry[0] > now:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return dict(entry[2])
+            self._entries.pop(user_id, None)
+            self.misses += 1
+
+        user_data = db.get_user_by_id(user_id)
+        if user_data:
+            self._store(user_id, user_data)
+        return user_data
+
+    def _store(self, user_id, user_data):
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, user_data.get('version', 0), dict(user_data))
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(str(user_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _maybe_sync(self, db):
+        now = time.monotonic()
+        if now < self._next_sync:
+            return
+        with self._lock:
+            if now < self._next_sync:
+                return
+            self._next_sync = now + self.sync_interval
+            since = self._last_sync
+        started = datetime.now(timezone.utc)
+
+        if since is None:
+            # Nothing cached from before this worker started, so nothing to reconcile
+            self._last_sync = started
+            return
+
+        try:
+            changed = db.directory.users.find(
+                {'updated_at': {'$gte': (since - self.SYNC_SKEW).isoformat()}},
+                {'version': 1}
+            )
+            changed = {str(user['_id']): user.get('version', 0) for user in changed}
+        except Exception as e:
+            print(f"User cache sync failed: {e}")
+            return
+
+        with self._lock:
+            for user_id, version in changed.items():
+                entry = self._entries.get(user_id)
+                if entry and entry[1] < version:
+                    del self._entries[user_id]
+            self._last_sync = started
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+def version_bump():
+    """Update fragment that marks a user document as changed for cache sync"""
+    return {
+        '$inc': {'version': 1},
+        '$set': {'updated_at': datetime.now(timezone.utc).isoformat()},
+    }
+
+
+user_cache = UserCache(
+    maxsize=Config.USER_CACHE_SIZE,
+    ttl=Config.USER_CACHE_TTL,
+    sync_interval=Config.USER_CACHE_SYNC_INTERVAL,
+)